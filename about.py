@@ -1,8 +1,6 @@
 from dash import Dash, html, dcc
 import dash_bootstrap_components as dbc
 
-app = Dash(__name__, external_stylesheets=[dbc.themes.SPACELAB, dbc.icons.FONT_AWESOME])
-
 book_img = "https://user-images.githubusercontent.com/72614349/185497519-733bdfc3-5731-4419-9a68-44c1cad04a78.png"
 nostarch = "https://nostarch.com/book-dash"
 github = "fa-brands fa-github"
@@ -75,7 +73,7 @@ card = dbc.Card(
     style={"maxWidth": "32rem"},
 )
 
-app.layout = dbc.Container(card, fluid=True)
-
 if __name__ == "__main__":
+    app = Dash(__name__, external_stylesheets=[dbc.themes.SPACELAB, dbc.icons.FONT_AWESOME])
+    app.layout = dbc.Container(card, fluid=True)
     app.run_server(debug=True)
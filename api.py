@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import json
+import math
+import os
+import flask
+import numpy as np
+from werkzeug.exceptions import RequestEntityTooLarge
+import engine
+
+"""
+==========================================================================
+Batch JSON API for scoring many portfolios in one request
+
+POST /api/backtest with a list of portfolios:
+
+    {"portfolios": [
+        {"weights": {"cash": 0.1, "bonds": 0.4, "stocks": 0.5},
+         "start_yr": 2007, "planning_time": 15, "start_bal": 10000},
+        ...
+    ]}
+
+weights are fractions of the portfolio for any of the keys in WEIGHT_KEYS
+and add up to 1.  start_bal is optional.  Every portfolio is rebalanced
+annually and the whole batch is evaluated at once over the same returns as
+backtest().  The response is streamed, with one result per portfolio in the
+same order:
+
+    {"results": [
+        {"ending_balance": 33293.12, "cagr": 0.0799, "worst_return": -0.1828,
+         "worst_year": 2008},
+        ...
+    ]}
+
+Invalid requests get a 400 response with the error and the index of the
+portfolio, and requests over the size limits a 413 response.
+"""
+
+# request keys for the weights of each asset in engine.ASSETS
+WEIGHT_KEYS = {
+    "cash": engine.CASH,
+    "bonds": engine.BONDS,
+    "stocks": engine.STOCKS,
+    "corp_bonds": engine.CORP_BONDS,
+}
+
+MAX_PORTFOLIOS = int(os.environ.get("BATCH_MAX_PORTFOLIOS", 10_000))
+MAX_REQUEST_BYTES = int(os.environ.get("BATCH_MAX_REQUEST_BYTES", 4 * 2**20))
+
+# results serialized per chunk of the streamed response
+STREAM_CHUNK = 1000
+
+DEFAULT_START_BAL = 10000
+# keeps the ending balances finite and JSON serializable
+MAX_START_BAL = 1e12
+
+
+class BatchError(ValueError):
+    def __init__(self, message, index=None, status=400):
+        super().__init__(message)
+        self.index = index
+        self.status = status
+
+
+def parse_portfolios(body, min_yr, max_yr):
+    """returns arrays of the weights (portfolios x assets), first row of
+    returns, number of years and starting balance of each portfolio
+    """
+
+    portfolios = body.get("portfolios") if isinstance(body, dict) else None
+    if not isinstance(portfolios, list) or not portfolios:
+        raise BatchError('expected {"portfolios": [...]} with at least one portfolio')
+    if len(portfolios) > MAX_PORTFOLIOS:
+        raise BatchError(
+            f"{len(portfolios)} portfolios, the limit is {MAX_PORTFOLIOS}", status=413
+        )
+
+    columns = {asset: i for i, asset in enumerate(engine.ASSETS)}
+    weights = np.zeros((len(portfolios), len(engine.ASSETS)))
+    start_yr = np.empty(len(portfolios), dtype=int)
+    nper = np.empty(len(portfolios), dtype=int)
+    start_bal = np.empty(len(portfolios))
+    for i, portfolio in enumerate(portfolios):
+        if not isinstance(portfolio, dict):
+            raise BatchError("portfolio is not an object", i)
+        portfolio_weights = portfolio.get("weights")
+        if not isinstance(portfolio_weights, dict) or not portfolio_weights:
+            raise BatchError("weights is not an object", i)
+        for key, weight in portfolio_weights.items():
+            if key not in WEIGHT_KEYS:
+                raise BatchError(
+                    f"unknown asset {key!r}, expected one of {list(WEIGHT_KEYS)}", i
+                )
+            if not is_number(weight) or not 0 <= weight <= 1:
+                raise BatchError(f"weight of {key} is not between 0 and 1", i)
+            weights[i, columns[WEIGHT_KEYS[key]]] = weight
+
+        start_yr[i] = integer(portfolio, "start_yr", i, min_yr, max_yr)
+        nper[i] = integer(portfolio, "planning_time", i, 1, max_yr - min_yr + 1)
+        bal = portfolio.get("start_bal", DEFAULT_START_BAL)
+        if not is_number(bal) or not 0 < bal <= MAX_START_BAL:
+            raise BatchError(
+                f"start_bal is not a number from 0 to {MAX_START_BAL:g}", i
+            )
+        start_bal[i] = bal
+
+    bad = np.flatnonzero(np.abs(weights.sum(axis=1) - 1) > 1e-6)
+    if bad.size:
+        raise BatchError("weights don't add up to 1", int(bad[0]))
+    bad = np.flatnonzero(start_yr + nper - 1 > max_yr)
+    if bad.size:
+        raise BatchError(
+            f"planning_time goes past {max_yr}, the last year", int(bad[0])
+        )
+    return weights, start_yr - min_yr, nper, start_bal
+
+
+def is_number(value):
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
+
+
+def integer(portfolio, key, index, low, high):
+    """the value of key, checked before it goes into an int array, where a
+    huge Python int would overflow
+    """
+
+    value = portfolio.get(key)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise BatchError(f"{key} is not an integer", index)
+    if not low <= value <= high:
+        raise BatchError(f"{key} is not from {low} to {high}", index)
+    return value
+
+
+def score(returns, min_yr, weights, first, nper, start_bal):
+    """ending balance, CAGR and worst year of every portfolio as lists"""
+
+    stats = engine.window_stats(returns, weights, first, nper)
+    return {
+        "ending_balance": (start_bal * stats["growth"]).round(2).tolist(),
+        "cagr": stats["cagr"].tolist(),
+        "worst_return": stats["worst"].tolist(),
+        "worst_year": (min_yr + stats["worst_row"]).tolist(),
+    }
+
+
+def stream_results(results):
+    """the results as a JSON document, serialized STREAM_CHUNK rows at a time"""
+
+    keys = list(results)
+    rows = list(zip(*results.values()))
+    yield '{"results": ['
+    for start in range(0, len(rows), STREAM_CHUNK):
+        chunk = (
+            json.dumps(dict(zip(keys, row)), allow_nan=False)
+            for row in rows[start : start + STREAM_CHUNK]
+        )
+        yield ("," if start else "") + ",".join(chunk)
+    yield "]}"
+
+
+def register(app, returns, min_yr, max_yr, route="/api/backtest"):
+    """adds the batch endpoint to the Flask server of the Dash app.  returns
+    has one column per asset in engine.ASSETS and one row per year from min_yr
+    """
+
+    returns = returns[:, : len(engine.ASSETS)]
+    min_yr, max_yr = int(min_yr), int(max_yr)
+    # also limits chunked requests, which have no Content-Length to check
+    if app.server.config.get("MAX_CONTENT_LENGTH") is None:
+        app.server.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+
+    @app.server.route(route, methods=["POST"])
+    def batch_backtest():
+        try:
+            length = flask.request.content_length
+            if length is not None and length > MAX_REQUEST_BYTES:
+                raise BatchError(
+                    f"request is {length} bytes, the limit is {MAX_REQUEST_BYTES}",
+                    status=413,
+                )
+            try:
+                flask.request.get_data()
+                # a chunked request is cut off at MAX_CONTENT_LENGTH, and
+                # reading past that raises
+                flask.request.stream.read(1)
+            except RequestEntityTooLarge:
+                raise BatchError(
+                    f"request is over the limit of {MAX_REQUEST_BYTES} bytes",
+                    status=413,
+                )
+            body = flask.request.get_json(silent=True)
+            if body is None:
+                raise BatchError("request body is not JSON")
+            weights, first, nper, start_bal = parse_portfolios(body, min_yr, max_yr)
+        except BatchError as e:
+            error = {"error": str(e)}
+            if e.index is not None:
+                error["index"] = e.index
+            return flask.jsonify(error), e.status
+
+        results = score(returns, min_yr, weights, first, nper, start_bal)
+        return flask.Response(stream_results(results), mimetype="application/json")
@@ -1,9 +1,27 @@
 # -*- coding: utf-8 -*-
 from dash import Dash, dcc, html, dash_table, Input, Output, State, callback_context
+from dash import ClientsideFunction, Patch, no_update
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import pandas as pd
+import numpy as np
+import os
+import atexit
+import tempfile
+import functools
+import json
+import flask
+from plotly.io.json import to_json_plotly
 import about
+import api
+import cache
+import engine
+import grid
+import jobs
+import metrics
+import simulate
+import snapshot
+import windows
 
 app_description = """
 How does asset allocation affect portfolio performance?   Select the percentage of stocks, bonds and cash
@@ -32,23 +50,77 @@ app = Dash(
     title=app_title,
 )
 
-#  make dataframe from  spreadsheet:
-df = pd.read_csv("assets/historic.csv")
+#  make dataframe from the spreadsheet, or its binary snapshot.  Since data
+#  is as of year end, the first row is the year before MIN_YR
+df = snapshot.load_historic()
 
 MAX_YR = df.Year.max()
-MIN_YR = df.Year.min()
+MIN_YR = df.Year.iat[1]
 START_YR = 2007
 
-# since data is as of year end, need to add start year
-df = (
-    pd.concat([df, pd.DataFrame([{"Year": MIN_YR - 1}])], ignore_index=True)
-    .sort_values("Year", ignore_index=True)
-    .fillna(0)
-)
+# annual returns from MIN_YR for engine.ASSETS and inflation (the last column)
+RETURNS = df.loc[1:, engine.ASSETS + [engine.INFLATION]].to_numpy()
+
+# With several worker processes, set SHARED_DATA_DIR to a directory they all
+# can write to.  The precomputed results are then memory-mapped from files
+# there, so adding workers doesn't add copies, and the update_totals results
+# cache is an SQLite file there, shared by the workers and kept when they
+# are restarted.
+SHARED_DATA_DIR = os.environ.get("SHARED_DATA_DIR")
+
+# Set BACKGROUND_CALLBACKS=on to run the Monte Carlo simulation as a
+# background job in a child process instead of on the request thread.  The
+# chart then shows the progress, the job is cancelled with a button or when
+# the inputs change, and identical jobs are only run once.  The jobs are kept
+# in SHARED_DATA_DIR, so every worker can poll them.  Without it they are in
+# a new private temp directory, which only this process and the workers
+# forked from it can read, since the job store holds pickles.
+BACKGROUND_CALLBACKS = os.environ.get("BACKGROUND_CALLBACKS", "off") == "on"
+if BACKGROUND_CALLBACKS:
+    if SHARED_DATA_DIR:
+        jobs_dir = SHARED_DATA_DIR
+    else:
+        jobs_dir = tempfile.mkdtemp(prefix="asset-allocation-jobs-")  # mode 0700
+        atexit.register(jobs.remove_directory, jobs_dir, os.getpid())
+    job_manager = jobs.JobManager(os.path.join(jobs_dir, "jobs.sqlite"))
+
+# ending balance and cagr for every slider allocation and time period
+if SHARED_DATA_DIR:
+    result_grid = grid.ResultGrid.shared(RETURNS[:, :-1], MIN_YR, SHARED_DATA_DIR)
+else:
+    result_grid = grid.ResultGrid(RETURNS[:, :-1], MIN_YR)
+
+# cagr and worst year for any window of years and asset
+window_index = windows.WindowIndex(df)
+
+# backtest columns for each asset in engine.ASSETS: the My Portfolio holdings
+# and the balance when all in the asset
+ASSET_COLUMNS = ["Cash", "Bonds", "Stocks", "Corp Bonds"]
+SINGLE_ASSET_COLUMNS = ["all_cash", "all_bonds", "all_stocks", "all_corp_bonds"]
+
+# rebalancing policies to choose from: the label and the policy arguments of
+# engine.rebalance_paths()
+REBALANCING = {
+    "annual": ("Every year", {"policy": "annual"}),
+    "every-2": ("Every 2 years", {"policy": "every", "every": 2}),
+    "every-5": ("Every 5 years", {"policy": "every", "every": 5}),
+    "band-5": ("When 5% off target", {"policy": "band", "band": 0.05}),
+    "band-10": ("When 10% off target", {"policy": "band", "band": 0.10}),
+    "never": ("Never (buy and hold)", {"policy": "never"}),
+}
+
+# portfolios that can be pinned to compare with My Portfolio, and the colors
+# of their lines
+MAX_PINNED = 3
+PINNED_COLORS = ["#6c757d", "#20c997", "#e83e8c"]
+
+# allocations shown by Find My Allocation, the best and the runners-up
+OPTIMIZER_RESULTS = 5
 
 COLORS = {
     "cash": "#3cb521",
     "bonds": "#fd7e14",
+    "corp_bonds": "#6f42c1",
     "stocks": "#446e9b",
     "inflation": "#cd0200",
     "background": "whitesmoke",
@@ -71,7 +143,7 @@ asset_allocation_text = dcc.Markdown(
     """
 > **Asset allocation** is one of the main factors that drive portfolio risk and returns.   Play with the app and see for yourself!
 
-> Change the allocation to cash, bonds and stocks on the sliders and see how your portfolio performs over time in the graph.
+> Change the allocation to cash, bonds, stocks and corporate bonds on the sliders and see how your portfolio performs over time in the graph.
   Try entering different time periods and dollar amounts too.
 """
 )
@@ -85,9 +157,12 @@ learn_text = dcc.Markdown(
     bonds vs stock) and see how this affects your returns.
 
     Note that the results shown in "My Portfolio" assumes rebalancing was done at
-    the beginning of every year.  Also, this information is based on the S&P 500 index
-    as a proxy for "stocks", the 10 year US Treasury Bond for "bonds" and the 3 month
-    US Treasury Bill for "cash."  Your results of course,  would be different based
+    the beginning of every year, unless you choose another way to rebalance on the
+    Play tab.  Rebalancing less often lets the winners grow to a bigger share of
+    the portfolio.  Also, this information is based on the S&P 500 index
+    as a proxy for "stocks", the 10 year US Treasury Bond for "bonds", Moody's Baa
+    rated corporate bonds for "corporate bonds" and the 3 month US Treasury Bill
+    for "cash."  Your results of course,  would be different based
     on your actual holdings.
 
     This is intended to help you determine your investment philosophy and understand
@@ -130,17 +205,30 @@ footer = html.Div(
 Tables
 """
 
+# Both tables are paged and sorted on the server so only the visible page is
+# sent to the browser
 total_returns_table = dash_table.DataTable(
     id="total_returns",
     columns=[{"id": "Year", "name": "Year", "type": "text"}]
     + [
         {"id": col, "name": col, "type": "numeric", "format": {"specifier": "$,.0f"}}
-        for col in ["Cash", "Bonds", "Stocks", "Total"]
+        for col in ["Cash Flow"] + ASSET_COLUMNS + ["Total"]
     ],
+    page_action="custom",
+    sort_action="custom",
+    page_current=0,
     page_size=15,
+    sort_by=[],
     style_table={"overflowX": "scroll"},
 )
 
+
+@functools.cache
+def annual_returns_records():
+    """rows of the annual returns table, made on the first page request"""
+    return df.to_dict("records")
+
+
 annual_returns_pct_table = dash_table.DataTable(
     id="annual_returns_pct",
     columns=(
@@ -150,13 +238,39 @@ annual_returns_pct_table = dash_table.DataTable(
             for col in df.columns[1:]
         ]
     ),
-    data=df.to_dict("records"),
-    sort_action="native",
+    page_action="custom",
+    sort_action="custom",
+    page_current=0,
     page_size=15,
+    page_count=-(-len(df) // 15),
+    sort_by=[],
     style_table={"overflowX": "scroll"},
 )
 
 
+def table_page(rows, page_current, page_size, sort_by, columns):
+    """sorts the rows and returns the columns of the rows on the current page,
+    the page count and the current page, moved back if past the last page
+    """
+
+    for sort in reversed(sort_by or []):
+        rows = sorted(
+            rows,
+            key=lambda row: row[sort["column_id"]],
+            reverse=sort["direction"] == "desc",
+        )
+
+    page_count = max(-(-len(rows) // page_size), 1)
+    page_current = min(page_current or 0, page_count - 1)
+    start = page_current * page_size
+    page = [
+        {col["id"]: row[col["id"]] for col in columns}
+        for row in rows[start : start + page_size]
+    ]
+    return page, page_count, page_current
+
+
+@metrics.timed("summary_table")
 def make_summary_table(dff):
     """Make html table to show cagr and  best and worst periods"""
 
@@ -170,6 +284,9 @@ def make_summary_table(dff):
     stocks = html.Span(
         [html.I(className="fa fa-industry"), " Stocks"], className=table_class
     )
+    corp_bonds = html.Span(
+        [html.I(className="fa fa-building"), " Corp Bonds"], className=table_class
+    )
     inflation = html.Span(
         [html.I(className="fa fa-ambulance"), " Inflation"], className=table_class
     )
@@ -177,19 +294,28 @@ def make_summary_table(dff):
     start_yr = dff["Year"].iat[0]
     end_yr = dff["Year"].iat[-1]
 
+    def window_cagr(asset):
+        return f"{window_index.cagr(asset, start_yr + 1, end_yr):.1%}"
+
+    def window_worst(asset):
+        worst_yr_loss, worst_yr = window_index.worst(asset, start_yr, end_yr)
+        return f"{worst_yr_loss:.1%} in {worst_yr}"
+
     df_table = pd.DataFrame(
         {
-            "": [cash, bonds, stocks, inflation],
+            "": [cash, bonds, stocks, corp_bonds, inflation],
             f"Rate of Return (CAGR) from {start_yr} to {end_yr}": [
-                cagr(dff["all_cash"]),
-                cagr(dff["all_bonds"]),
-                cagr(dff["all_stocks"]),
-                cagr(dff["inflation_only"]),
+                window_cagr("3-mon T.Bill"),
+                window_cagr("10yr T.Bond"),
+                window_cagr("S&P 500"),
+                window_cagr(" Baa Corp Bond"),
+                window_cagr("Inflation"),
             ],
             f"Worst 1 Year Return": [
-                worst(dff, "3-mon T.Bill"),
-                worst(dff, "10yr T.Bond"),
-                worst(dff, "S&P 500"),
+                window_worst("3-mon T.Bill"),
+                window_worst("10yr T.Bond"),
+                window_worst("S&P 500"),
+                window_worst(" Baa Corp Bond"),
                 "",
             ],
         }
@@ -197,6 +323,31 @@ def make_summary_table(dff):
     return dbc.Table.from_dataframe(df_table, bordered=True, hover=True)
 
 
+def add_pinned_rows(summary_table, pinned):
+    """the make_summary_table() table with a row for each pinned portfolio in
+    the pinned_stats() dataframe, reusing the cached rows of the assets"""
+
+    header, body = summary_table.children
+    rows = [
+        html.Tr(
+            [
+                html.Td(
+                    html.Span(
+                        [html.I(className="fa fa-thumbtack"), f" {label}"],
+                        className="h5 text-body text-nowrap",
+                    )
+                ),
+                html.Td(f"{cagr:.1%}"),
+                html.Td(f"{worst:.1%} in {worst_yr}"),
+            ]
+        )
+        for label, cagr, worst, worst_yr in pinned.itertuples(index=False)
+    ]
+    return dbc.Table(
+        [header, html.Tbody(body.children + rows)], bordered=True, hover=True
+    )
+
+
 """
 ==========================================================================
 Figures
@@ -207,11 +358,18 @@ def make_pie(slider_input, title):
     fig = go.Figure(
         data=[
             go.Pie(
-                labels=["Cash", "Bonds", "Stocks"],
+                labels=["Cash", "Bonds", "Stocks", "Corp Bonds"],
                 values=slider_input,
                 textinfo="label+percent",
                 textposition="inside",
-                marker={"colors": [COLORS["cash"], COLORS["bonds"], COLORS["stocks"]]},
+                marker={
+                    "colors": [
+                        COLORS["cash"],
+                        COLORS["bonds"],
+                        COLORS["stocks"],
+                        COLORS["corp_bonds"],
+                    ]
+                },
                 sort=False,
                 hoverinfo="none",
             )
@@ -227,6 +385,11 @@ def make_pie(slider_input, title):
     return fig
 
 
+# columns plotted by make_line_chart, in trace order
+LINE_CHART_COLUMNS = SINGLE_ASSET_COLUMNS + ["Total", "inflation_only"]
+
+
+@metrics.timed("line_chart")
 def make_line_chart(dff):
     start = dff.loc[1, "Year"]
     yrs = dff["Year"].size - 1
@@ -257,6 +420,14 @@ def make_line_chart(dff):
             marker_color=COLORS["stocks"],
         )
     )
+    fig.add_trace(
+        go.Scatter(
+            x=dff["Year"],
+            y=dff["all_corp_bonds"],
+            name="All Corp Bonds (Baa)",
+            marker_color=COLORS["corp_bonds"],
+        )
+    )
     fig.add_trace(
         go.Scatter(
             x=dff["Year"],
@@ -288,6 +459,234 @@ def make_line_chart(dff):
     return fig
 
 
+def make_pinned_traces(years, balances, labels):
+    """line chart traces of the pinned portfolios, added after
+    LINE_CHART_COLUMNS.  Plain dicts like results_figure(), since validating
+    go.Scatter traces takes longer than computing the balances.
+    """
+
+    return [
+        {
+            "type": "scatter",
+            "x": years,
+            "y": balances[:, i].tolist(),
+            "name": label,
+            "marker": {"color": PINNED_COLORS[i % len(PINNED_COLORS)]},
+            "line": {"width": 3, "dash": "dash"},
+        }
+        for i, label in enumerate(labels)
+    ]
+
+
+def make_rolling_chart(dff):
+    """bar chart of the CAGR of every period with the same number of years"""
+
+    yrs = dff["End"].iat[0] - dff["Start"].iat[0] + 1
+    fig = go.Figure()
+    fig.add_trace(
+        go.Bar(
+            x=dff["Start"],
+            y=dff["CAGR"],
+            name="My Portfolio",
+            marker_color=[
+                COLORS["stocks"] if beat else COLORS["inflation"]
+                for beat in dff["CAGR"] > dff["Inflation"]
+            ],
+            customdata=dff["End"],
+            hovertemplate="%{x}-%{customdata}: %{y:.1%}<extra></extra>",
+        )
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=dff["Start"],
+            y=dff["Inflation"],
+            name="Inflation",
+            marker_color="black",
+            hovertemplate="%{x}-%{customdata}: %{y:.1%}<extra></extra>",
+            customdata=dff["End"],
+        )
+    )
+    fig.update_layout(
+        title=f"CAGR for every {yrs} year period",
+        template="none",
+        showlegend=True,
+        legend=dict(x=0.01, y=0.99, orientation="h"),
+        height=350,
+        margin=dict(l=50, r=10, t=60, b=55),
+        yaxis=dict(tickformat=".0%", fixedrange=True),
+        xaxis=dict(title="Start Year", fixedrange=True),
+    )
+    return fig
+
+
+def make_cagr_heatmap(cagrs, planning_time, start_yr):
+    """heatmap of the CAGR (start years x years) of every period, with the
+    selected period marked
+    """
+
+    start = np.arange(MIN_YR, MIN_YR + cagrs.shape[0])
+    years = np.arange(1, cagrs.shape[1] + 1)
+    fig = go.Figure()
+    fig.add_trace(
+        go.Heatmap(
+            x=start,
+            y=years,
+            z=cagrs.T.astype(np.float32),  # half the bytes, as precise as shown
+            zmid=0,
+            colorscale=[
+                [0, COLORS["inflation"]],
+                [0.5, "white"],
+                [1, COLORS["stocks"]],
+            ],
+            colorbar=dict(title="CAGR", tickformat=".0%", thickness=10),
+            hovertemplate="%{y} years from %{x}: %{z:.1%}<extra></extra>",
+            hoverongaps=False,
+        )
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=[start_yr],
+            y=[planning_time],
+            mode="markers",
+            name="Selected Period",
+            hoverinfo="skip",
+            marker=dict(color="black", symbol="star", size=14),
+        )
+    )
+    fig.update_layout(
+        title="CAGR for every start year and number of years",
+        template="none",
+        showlegend=False,
+        height=500,
+        margin=dict(l=50, r=10, t=60, b=55),
+        yaxis=dict(title="Years", fixedrange=True),
+        xaxis=dict(title="Start Year", fixedrange=True),
+    )
+    return fig
+
+
+def make_simulation_chart(percentiles, start_bal, paths, method):
+    """fan chart of the percentiles of simulated balances by year"""
+
+    yrs = percentiles.shape[1] - 1
+    x = list(range(yrs + 1))
+    balances = percentiles * start_bal
+    dtick = 1 if yrs < 16 else 2 if yrs in range(16, 30) else 5
+
+    fig = go.Figure()
+    for (low, high), name, opacity in [
+        ((0, 4), "5th - 95th percentile", 0.2),
+        ((1, 3), "25th - 75th percentile", 0.4),
+    ]:
+        fig.add_trace(
+            go.Scatter(
+                x=x,
+                y=balances[high],
+                line=dict(width=0),
+                marker_color=COLORS["stocks"],
+                showlegend=False,
+                hoverinfo="skip",
+                legendgroup=name,
+            )
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=x,
+                y=balances[low],
+                name=name,
+                fill="tonexty",
+                fillcolor=f"rgba(68, 110, 155, {opacity})",
+                line=dict(width=0),
+                hoverinfo="skip",
+                legendgroup=name,
+            )
+        )
+    fig.add_trace(
+        go.Scatter(
+            x=x,
+            y=balances[2],
+            name="Median",
+            marker_color="black",
+            line=dict(width=3),
+        )
+    )
+    fig.update_layout(
+        title=f"{paths:,} simulated {yrs} year periods - {method}",
+        template="none",
+        showlegend=True,
+        legend=dict(x=0.01, y=0.99),
+        height=400,
+        margin=dict(l=40, r=10, t=60, b=55),
+        yaxis=dict(tickprefix="$", fixedrange=True),
+        xaxis=dict(title="Years", fixedrange=True, dtick=dtick),
+    )
+    return fig
+
+
+# x axis choices of the risk and return chart
+FRONTIER_RISKS = {
+    "Volatility": "Volatility",
+    "Worst": "Worst 1 Year Return",
+    "Max Drawdown": "Max Drawdown",
+}
+
+
+def make_frontier_chart(dff, risk):
+    """scatter plot of risk against CAGR for every slider allocation, with the
+    selected allocation (the last row) highlighted
+    """
+
+    sweep, selected = dff.iloc[:-1], dff.iloc[-1]
+    hovertemplate = (
+        "%{customdata[0]}% cash, %{customdata[1]}% bonds, %{customdata[2]}% stocks,"
+        " %{customdata[3]}% corp bonds"
+        "<br>CAGR: %{y:.1%}<br>" + risk + ": %{x:.1%}<extra></extra>"
+    )
+    fig = go.Figure()
+    fig.add_trace(
+        go.Scatter(
+            x=sweep[risk],
+            y=sweep["CAGR"],
+            mode="markers",
+            name="Allocations",
+            customdata=sweep[ASSET_COLUMNS],
+            hovertemplate=hovertemplate,
+            marker=dict(
+                color=sweep["Stocks"],
+                colorscale=[[0, COLORS["bonds"]], [1, COLORS["stocks"]]],
+                size=8,
+                colorbar=dict(title="Stocks %", thickness=10),
+            ),
+        )
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=[selected[risk]],
+            y=[selected["CAGR"]],
+            mode="markers",
+            name="My Portfolio",
+            customdata=[selected[ASSET_COLUMNS]],
+            hovertemplate=hovertemplate,
+            marker=dict(color="black", symbol="star", size=18),
+        )
+    )
+    fig.update_layout(
+        title="Risk and Return for every allocation",
+        template="none",
+        showlegend=True,
+        legend=dict(x=0.01, y=0.99),
+        height=400,
+        margin=dict(l=50, r=10, t=60, b=55),
+        yaxis=dict(title="CAGR", tickformat=".0%", fixedrange=True),
+        xaxis=dict(
+            title=FRONTIER_RISKS[risk],
+            tickformat=".0%",
+            fixedrange=True,
+        ),
+    )
+    return fig
+
+
 """
 ==========================================================================
 Make Tabs
@@ -310,10 +709,23 @@ slider_card = dbc.Card(
             included=False,
         ),
         html.H4(
-            "Then set stock allocation % ",
+            "Then set corporate bond allocation %:",
+            className="card-title mt-3",
+        ),
+        dcc.Slider(
+            id="corp_bonds",
+            marks={i: f"{i}%" for i in range(0, 91, 10)},
+            min=0,
+            max=90,
+            step=5,
+            value=0,
+            included=False,
+        ),
+        html.H4(
+            "And stock allocation % ",
             className="card-title mt-3",
         ),
-        html.Div("(The rest will be bonds)", className="card-title"),
+        html.Div("(The rest will be treasury bonds)", className="card-title"),
         dcc.Slider(
             id="stock_bond",
             marks={i: f"{i}%" for i in range(0, 91, 10)},
@@ -420,6 +832,42 @@ number_of_years = dbc.InputGroup(
     ],
     className="mb-3",
 )
+contribution_input = dbc.InputGroup(
+    [
+        dbc.InputGroupText("Add Each Year $"),
+        dbc.Input(
+            id="contribution",
+            placeholder="$0",
+            type="number",
+            min=0,
+            value=0,
+        ),
+    ],
+    className="mb-3",
+)
+withdrawal_input = dbc.InputGroup(
+    [
+        dbc.InputGroupText(
+            "Withdraw Each Year %",
+            id="withdrawal_tooltip_target",
+            className="text-decoration-underline",
+        ),
+        dbc.Input(
+            id="withdrawal",
+            placeholder="0%",
+            type="number",
+            min=0,
+            max=100,
+            step=0.1,
+            value=0,
+        ),
+        dbc.Tooltip(
+            "A percent of the start amount, raised with inflation every year",
+            target="withdrawal_tooltip_target",
+        ),
+    ],
+    className="mb-3",
+)
 end_amount = dbc.InputGroup(
     [
         dbc.InputGroupText("Ending Amount"),
@@ -440,17 +888,133 @@ rate_of_return = dbc.InputGroup(
     className="mb-3",
 )
 
+rebalancing = dbc.InputGroup(
+    [
+        dbc.InputGroupText("Rebalance"),
+        dbc.Select(
+            id="rebalance",
+            options=[
+                {"label": label, "value": value}
+                for value, (label, _) in REBALANCING.items()
+            ],
+            value="annual",
+        ),
+    ],
+    className="mb-3",
+)
+
+compare_buttons = html.Div(
+    [
+        dbc.Button(
+            "Pin to Compare",
+            id="pin_portfolio",
+            color="primary",
+            size="sm",
+            className="me-2",
+        ),
+        dbc.Button("Clear Pinned", id="clear_pinned", color="secondary", size="sm"),
+        dbc.FormText(
+            f"Pin up to {MAX_PINNED} allocations to compare them with My Portfolio",
+            className="d-block",
+        ),
+        # [stocks, cash, corp_bonds] of each pinned portfolio
+        dcc.Store(id="pinned", data=[]),
+    ],
+    className="mb-3",
+)
+
 input_groups = html.Div(
-    [start_amount, start_year, number_of_years, end_amount, rate_of_return],
+    [
+        start_amount,
+        start_year,
+        number_of_years,
+        rebalancing,
+        contribution_input,
+        withdrawal_input,
+        end_amount,
+        rate_of_return,
+        compare_buttons,
+    ],
     className="mt-4 p-4",
 )
 
 
+# ======= Simulation components
+
+simulation_methods = {
+    "iid": "Resample single years",
+    "block": "Resample 5 year blocks",
+}
+
+simulation_card = dbc.Card(
+    [
+        dbc.CardHeader("Simulated Returns - Resampled from History"),
+        dbc.CardBody(
+            [
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            dbc.RadioItems(
+                                id="simulation_method",
+                                options=[
+                                    {"label": label, "value": value}
+                                    for value, label in simulation_methods.items()
+                                ],
+                                value="block",
+                                inline=True,
+                            ),
+                            width="auto",
+                        ),
+                        dbc.Col(
+                            dbc.Select(
+                                id="simulation_paths",
+                                options=[
+                                    {"label": f"{n:,} paths", "value": n}
+                                    for n in [1_000, 10_000, 100_000]
+                                    + ([1_000_000] if BACKGROUND_CALLBACKS else [])
+                                ],
+                                value=10_000,
+                                size="sm",
+                            ),
+                            width="auto",
+                        ),
+                    ],
+                    justify="between",
+                ),
+                # shown while a background job runs the simulation
+                dbc.Row(
+                    [
+                        dbc.Col(dbc.Progress(id="simulation_progress", value=0)),
+                        dbc.Col(
+                            dbc.Button(
+                                "Cancel",
+                                id="cancel_simulation",
+                                color="secondary",
+                                size="sm",
+                            ),
+                            width="auto",
+                        ),
+                    ],
+                    id="simulation_running",
+                    align="center",
+                    className="mt-3",
+                    style={"display": "none"},
+                ),
+                dcc.Graph(id="simulation_chart"),
+                # percentiles of the growth of $1, scaled to the start amount
+                dcc.Store(id="simulation_results"),
+            ]
+        ),
+    ],
+    className="mb-4",
+)
+
+
 # =====  Results Tab components
 
 results_card = dbc.Card(
     [
-        dbc.CardHeader("My Portfolio Returns - Rebalanced Annually"),
+        dbc.CardHeader("My Portfolio Returns"),
         html.Div(total_returns_table),
     ],
     className="mt-4",
@@ -466,6 +1030,131 @@ data_source_card = dbc.Card(
 )
 
 
+# ========= Rolling Periods Tab  Components
+rolling_text = dcc.Markdown(
+    f"""
+    How would your portfolio have done if you had started in a different year?  This shows
+    every period since {MIN_YR} with the number of years and rebalancing chosen on the Play tab.
+    """
+)
+
+withdrawal_text = dcc.Markdown(
+    """
+    How much could you have withdrawn every year?  The safe withdrawal rate is the
+    most you could take out each year, as a percent of the start amount raised with
+    inflation, without running out of money in any of these periods.
+    """,
+    className="mt-4",
+)
+
+rolling_card = dbc.Card(
+    [
+        dbc.CardHeader("My Portfolio Over Every Historical Period"),
+        dbc.CardBody(
+            [
+                rolling_text,
+                dcc.Graph(id="rolling_chart"),
+                html.Div(id="rolling_summary"),
+                withdrawal_text,
+                html.Div(id="withdrawal_summary"),
+            ]
+        ),
+    ],
+    className="mt-4",
+)
+
+
+heatmap_text = dcc.Markdown(
+    f"""
+    Every period since {MIN_YR} at once: each cell is the CAGR of your portfolio, rebalanced
+    every year, from a start year for a number of years.  Click a cell to choose that
+    period on the Play tab.  The star is the period chosen now.
+    """
+)
+
+heatmap_card = dbc.Card(
+    [
+        dbc.CardHeader("My Portfolio by Start Year and Number of Years"),
+        dbc.CardBody([heatmap_text, dcc.Graph(id="cagr_heatmap")]),
+    ],
+    className="mt-4",
+)
+
+
+# ========= Risk and Return Tab  Components
+frontier_text = dcc.Markdown(
+    """
+    Every mix of cash, treasury bonds and stocks you can choose with the sliders, over
+    the time period entered on the Play tab.  Higher risk allocations are to the right and allocations with
+    higher returns are at the top.  The star is your portfolio.
+    """
+)
+
+frontier_card = dbc.Card(
+    [
+        dbc.CardHeader("Risk and Return - All Allocations"),
+        dbc.CardBody(
+            [
+                frontier_text,
+                dbc.RadioItems(
+                    id="frontier_risk",
+                    options=[
+                        {"label": label, "value": value}
+                        for value, label in FRONTIER_RISKS.items()
+                    ],
+                    value="Volatility",
+                    inline=True,
+                ),
+                dcc.Graph(id="frontier_chart"),
+            ]
+        ),
+    ],
+    className="mt-4",
+)
+
+
+optimizer_text = dcc.Markdown(
+    """
+    Find the cash, treasury bonds, stocks and corporate bonds mix with the highest
+    rate of return over the time period entered on the Play tab that stays within the
+    losses you can live with.  Leave a limit empty to ignore it.  The best allocation
+    is set on the sliders.  The returns and losses are for rebalancing every year.
+    """
+)
+
+optimizer_card = dbc.Card(
+    [
+        dbc.CardHeader("Find My Allocation"),
+        dbc.CardBody(
+            [
+                optimizer_text,
+                dbc.InputGroup(
+                    [
+                        dbc.InputGroupText("Worst 1 Year Loss at most %"),
+                        dbc.Input(
+                            id="optimizer_max_loss", type="number", min=0, value=15
+                        ),
+                    ],
+                    className="mb-3",
+                ),
+                dbc.InputGroup(
+                    [
+                        dbc.InputGroupText("Max Drawdown at most %"),
+                        dbc.Input(
+                            id="optimizer_max_drawdown", type="number", min=0, value=25
+                        ),
+                    ],
+                    className="mb-3",
+                ),
+                dbc.Button("Find My Allocation", id="optimize", color="primary"),
+                html.Div(id="optimizer_results", className="mt-3"),
+            ]
+        ),
+    ],
+    className="mt-4",
+)
+
+
 # ========= Learn Tab  Components
 learn_card = dbc.Card(
     [
@@ -487,6 +1176,12 @@ tabs = dbc.Tabs(
             className="pb-4",
         ),
         dbc.Tab([results_card, data_source_card], tab_id="tab-3", label="Results"),
+        dbc.Tab(
+            [rolling_card, heatmap_card], tab_id="tab-4", label="Rolling Periods"
+        ),
+        dbc.Tab(
+            [frontier_card, optimizer_card], tab_id="tab-5", label="Risk and Return"
+        ),
     ],
     id="tabs",
     active_tab="tab-2",
@@ -500,15 +1195,110 @@ Helper functions to calculate investment results, cagr and worst periods
 """
 
 
-def backtest(stocks, cash, start_bal, nper, start_yr):
+# "numpy" uses the vectorized engine, "loop" the original year by year
+# reference implementation.  Both return identical dataframes.
+BACKTEST_ENGINE = os.environ.get("BACKTEST_ENGINE", "numpy")
+
+
+@metrics.timed("backtest")
+def backtest(
+    stocks,
+    cash,
+    start_bal,
+    nper,
+    start_yr,
+    corp_bonds=0,
+    rebalance="annual",
+    contribution=0,
+    withdrawal=0,
+):
     """calculates the investment returns for user selected asset allocation,
-    rebalanced annually and returns a dataframe
+    rebalanced by the REBALANCING policy and returns a dataframe.  The
+    contribution in dollars is added and the withdrawal, a percent of the
+    starting balance raised with inflation, is taken at the start of every year.
     """
 
+    if BACKTEST_ENGINE == "loop":
+        return backtest_loop(
+            stocks,
+            cash,
+            start_bal,
+            nper,
+            start_yr,
+            corp_bonds,
+            rebalance,
+            contribution,
+            withdrawal,
+        )
+
     end_yr = start_yr + nper - 1
-    cash_allocation = cash / 100
+
+    # Select time period - since data is for year end, include year prior
+    # for start ie year[0]
+    dff = df[(df.Year >= start_yr - 1) & (df.Year <= end_yr)].reset_index(drop=True)
+    dff["Year"] = dff["Year"].astype(int)
+
+    # calculate My Portfolio and the single asset and inflation returns in
+    # one pass
+    returns = dff.loc[1:, engine.ASSETS + [engine.INFLATION]].to_numpy()
+    weights = engine.allocation_weights(stocks, cash, corp_bonds)
+    return dff.assign(
+        **portfolio_columns(
+            returns, weights, start_bal, rebalance, contribution, withdrawal
+        )
+    )
+
+
+def portfolio_columns(
+    returns, weights, start_bal, rebalance="annual", contribution=0, withdrawal=0
+):
+    """calculates the My Portfolio holdings, total and cash flows, the single
+    asset and inflation columns for backtest(), rounded to dollars
+    """
+
+    flows = None
+    if contribution or withdrawal:
+        flows = engine.cash_flows(
+            returns[:, -1], contribution, withdrawal / 100 * start_bal
+        )
+    holdings, balances, rebalanced = engine.backtest_arrays(
+        returns, weights, start_bal, **REBALANCING[rebalance][1], flows=flows
+    )
+    unrounded = balances[:, 0]
+    holdings = holdings.round(0)
+    balances = balances.round(0)
+    columns = dict(zip(ASSET_COLUMNS, holdings.T))
+    columns["Total"] = balances[:, 0]
+    columns["Rebalance"] = rebalanced
+    # the withdrawals actually paid, up to what was left
+    columns["Cash Flow"] = np.zeros(len(balances))
+    if flows is not None:
+        columns["Cash Flow"][1:] = np.maximum(flows, -unrounded[:-1]).round(0) + 0.0
+    columns.update(zip(SINGLE_ASSET_COLUMNS, balances[:, 1:-1].T))
+    columns["inflation_only"] = balances[:, -1]
+    return columns
+
+
+def backtest_loop(
+    stocks,
+    cash,
+    start_bal,
+    nper,
+    start_yr,
+    corp_bonds=0,
+    rebalance="annual",
+    contribution=0,
+    withdrawal=0,
+):
+    """reference implementation of backtest() that calculates the returns
+    year by year
+    """
+
+    end_yr = start_yr + nper - 1
+    cash_allocation = cash / 100
     stocks_allocation = stocks / 100
-    bonds_allocation = (100 - stocks - cash) / 100
+    corp_bonds_allocation = corp_bonds / 100
+    bonds_allocation = (100 - stocks - cash - corp_bonds) / 100
 
     # Select time period - since data is for year end, include year prior
     # for start ie year[0]
@@ -521,19 +1311,56 @@ def backtest(stocks, cash, start_bal, nper, start_yr):
     dff["Cash"] = cash_allocation * start_bal
     dff["Bonds"] = bonds_allocation * start_bal
     dff["Stocks"] = stocks_allocation * start_bal
+    dff["Corp Bonds"] = corp_bonds_allocation * start_bal
     dff["Total"] = start_bal
     dff["Total"] = dff["Total"].astype(float)
     dff["Rebalance"] = True
+    dff["Cash Flow"] = 0.0
+    withdrawal_amount = withdrawal / 100 * start_bal
+    inflation_index = 1.0
+    holdings = ["Cash", "Bonds", "Stocks", "Corp Bonds"]
+    allocations = [
+        cash_allocation,
+        bonds_allocation,
+        stocks_allocation,
+        corp_bonds_allocation,
+    ]
 
     # calculate My Portfolio returns
     for yr in dff.Year + 1:
         if yr <= end_yr:
+            # the first year starts at the allocation, after that the policy
+            # decides from last period's holdings.  An empty portfolio starts
+            # again at the allocation.
+            if yr > start_yr:
+                last_total = dff.loc[yr - 1, "Total"]
+                dff.loc[yr, "Rebalance"] = last_total <= 0 or rebalance_due(
+                    rebalance,
+                    yr - start_yr,
+                    dff.loc[yr - 1, holdings] / last_total,
+                    allocations,
+                )
+                inflation_index *= 1 + dff.loc[yr - 1, "Inflation"]
+
+            # add the contribution and take the withdrawal, raised with
+            # inflation, at the beginning of the period
+            cash_flow = contribution - withdrawal_amount * inflation_index
+            # + 0.0 turns the -0.0 withdrawn from an empty portfolio into 0.0
+            dff.loc[yr, "Cash Flow"] = max(cash_flow, -dff.loc[yr - 1, "Total"]) + 0.0
+            balance = max(dff.loc[yr - 1, "Total"] + cash_flow, 0)
+
             # Rebalance at the beginning of the period by reallocating
             # last period's total ending balance
             if dff.loc[yr, "Rebalance"]:
-                dff.loc[yr, "Cash"] = dff.loc[yr - 1, "Total"] * cash_allocation
-                dff.loc[yr, "Stocks"] = dff.loc[yr - 1, "Total"] * stocks_allocation
-                dff.loc[yr, "Bonds"] = dff.loc[yr - 1, "Total"] * bonds_allocation
+                dff.loc[yr, "Cash"] = balance * cash_allocation
+                dff.loc[yr, "Stocks"] = balance * stocks_allocation
+                dff.loc[yr, "Bonds"] = balance * bonds_allocation
+                dff.loc[yr, "Corp Bonds"] = balance * corp_bonds_allocation
+            else:
+                # let last period's holdings drift
+                dff.loc[yr, holdings] = dff.loc[yr - 1, holdings] * (
+                    balance / dff.loc[yr - 1, "Total"]
+                )
 
             # calculate this period's  returns
             dff.loc[yr, "Cash"] = dff.loc[yr, "Cash"] * (
@@ -543,21 +1370,26 @@ def backtest(stocks, cash, start_bal, nper, start_yr):
             dff.loc[yr, "Bonds"] = dff.loc[yr, "Bonds"] * (
                 1 + dff.loc[yr, "10yr T.Bond"]
             )
-            dff.loc[yr, "Total"] = dff.loc[yr, ["Cash", "Bonds", "Stocks"]].sum()
+            dff.loc[yr, "Corp Bonds"] = dff.loc[yr, "Corp Bonds"] * (
+                1 + dff.loc[yr, " Baa Corp Bond"]
+            )
+            dff.loc[yr, "Total"] = dff.loc[
+                yr, ["Cash", "Bonds", "Stocks", "Corp Bonds"]
+            ].sum()
 
     dff = dff.reset_index(drop=True)
-    columns = ["Cash", "Stocks", "Bonds", "Total"]
+    columns = ["Cash", "Stocks", "Bonds", "Corp Bonds", "Total", "Cash Flow"]
     dff[columns] = dff[columns].round(0)
 
-    # create columns for when portfolio is all cash, all bonds or  all stocks,
-    #   include inflation too
+    # create columns for when portfolio is all cash, all bonds, all stocks or
+    #   all corp bonds, include inflation too
     #
     # create new df that starts in yr 1 rather than yr 0
     dff1 = (dff[(dff.Year >= start_yr) & (dff.Year <= end_yr)]).copy()
     #
     # calculate the returns in new df:
-    columns = ["all_cash", "all_bonds", "all_stocks", "inflation_only"]
-    annual_returns = ["3-mon T.Bill", "10yr T.Bond", "S&P 500", "Inflation"]
+    columns = ["all_cash", "all_bonds", "all_stocks", "all_corp_bonds", "inflation_only"]
+    annual_returns = ["3-mon T.Bill", "10yr T.Bond", "S&P 500", " Baa Corp Bond", "Inflation"]
     for col, return_pct in zip(columns, annual_returns):
         dff1[col] = round(start_bal * (1 + (1 + dff1[return_pct]).cumprod() - 1), 0)
     #
@@ -569,22 +1401,471 @@ def backtest(stocks, cash, start_bal, nper, start_yr):
     return dff
 
 
-def cagr(dff):
-    """calculate Compound Annual Growth Rate for a series and returns a formated string"""
+def rebalance_due(rebalance, years, weights, allocations):
+    """whether the REBALANCING policy rebalances after the number of years,
+    when the portfolio has drifted to the weights
+    """
+
+    policy = REBALANCING[rebalance][1]
+    if policy["policy"] == "every":
+        return years % policy["every"] == 0
+    if policy["policy"] == "band":
+        return any(abs(w - a) > policy["band"] for w, a in zip(weights, allocations))
+    return policy["policy"] == "annual"
+
+
+def valid_period(planning_time, start_yr):
+    """returns a valid planning time and start year for the inputs"""
+
+    # set defaults for invalid inputs, and whole years for the indexes
+    planning_time = 1 if planning_time is None else max(int(planning_time), 1)
+    start_yr = MIN_YR if start_yr is None else int(start_yr)
+
+    # calculate valid planning time start yr
+    max_time = MAX_YR + 1 - start_yr
+    planning_time = min(max_time, planning_time)
+    if start_yr + planning_time > MAX_YR:
+        start_yr = min(df.iloc[-planning_time, 0], MAX_YR)  # 0 is Year column
+    return int(planning_time), int(start_yr)
+
+
+def period_returns(planning_time, start_yr):
+    """annual returns of engine.ASSETS and inflation for the period"""
+
+    first = start_yr - MIN_YR
+    return RETURNS[first : first + planning_time]
+
+
+def allocation_sweep(stocks, cash, planning_time, start_yr, corp_bonds=0):
+    """calculates CAGR, volatility, worst year and maximum drawdown for every
+    cash, bonds and stocks slider allocation and the selected one (the last
+    row) over the period and returns a dataframe
+    """
+
+    weights = np.vstack(
+        [grid.WEIGHTS, engine.allocation_weights(stocks, cash, corp_bonds)]
+    )
+    returns = period_returns(planning_time, start_yr)
+    stats = engine.allocation_stats(returns[:, :-1], weights)
+    risk = engine.risk_metrics(
+        returns[:, :-1], weights, returns[:, engine.ASSETS.index(engine.CASH)]
+    )
+    percentages = (weights * 100).round().astype(int)
+    return pd.DataFrame(
+        {
+            **dict(zip(ASSET_COLUMNS, percentages.T)),
+            "CAGR": stats["cagr"],
+            "Volatility": stats["volatility"],
+            "Worst": stats["worst"],
+            "Worst Year": start_yr + stats["worst_row"],
+            "Max Drawdown": risk["max_drawdown"],
+        }
+    )
+
+
+def best_allocations(planning_time, start_yr, max_loss=None, max_drawdown=None):
+    """the allocations on the slider grid with the highest CAGR over the
+    period, rebalanced annually, within the losses, in percent, best first in
+    a dataframe"""
+
+    best = grid.best_allocations(
+        period_returns(planning_time, start_yr)[:, :-1],
+        None if max_loss is None else max_loss / 100,
+        None if max_drawdown is None else max_drawdown / 100,
+        n=OPTIMIZER_RESULTS,
+    )
+    weights = grid.SLIDER_WEIGHTS[best["allocation"]]
+    percentages = (weights * 100).round().astype(int)
+    return pd.DataFrame(
+        {
+            **dict(zip(ASSET_COLUMNS, percentages.T)),
+            "CAGR": best["cagr"],
+            "Worst": best["worst"],
+            "Worst Year": start_yr + best["worst_row"],
+            "Max Drawdown": best["max_drawdown"],
+        }
+    )
+
+
+def make_optimizer_table(dff):
+    """Make html table of the best_allocations(), the best one first"""
+
+    df_table = pd.DataFrame(
+        {
+            "": ["Best"] + [f"#{i}" for i in range(2, len(dff) + 1)],
+            "Cash": [f"{x}%" for x in dff["Cash"]],
+            "Bonds": [f"{x}%" for x in dff["Bonds"]],
+            "Stocks": [f"{x}%" for x in dff["Stocks"]],
+            "Corp Bonds": [f"{x}%" for x in dff["Corp Bonds"]],
+            "CAGR": [f"{x:.1%}" for x in dff["CAGR"]],
+            "Worst 1 Year Return": [
+                f"{x:.1%} in {yr}" for x, yr in zip(dff["Worst"], dff["Worst Year"])
+            ],
+            "Max Drawdown": [f"{x:.1%}" for x in dff["Max Drawdown"]],
+        }
+    )
+    return dbc.Table.from_dataframe(df_table, bordered=True, hover=True, size="sm")
+
+
+"""
+==========================================================================
+Cached results for update_totals
+"""
+
+# Results only depend on the starting balance and cash flows through the
+# dollar columns, so one cache entry serves every amount
+results_cache_limits = dict(
+    max_entries=int(os.environ.get("RESULTS_CACHE_MAX_ENTRIES", 512)),
+    max_bytes=int(os.environ.get("RESULTS_CACHE_MAX_BYTES", 64 * 2**20)),
+)
+if SHARED_DATA_DIR:
+    results_cache = cache.SharedCache(
+        os.path.join(SHARED_DATA_DIR, "results.sqlite"), **results_cache_limits
+    )
+else:
+    results_cache = cache.LRUCache(**results_cache_limits)
+
+
+def make_results(dff, stocks, cash, corp_bonds=0, rebalance="annual"):
+    """makes the parts of the update_totals results that don't depend on the
+    starting balance"""
+
+    results = {
+        "returns": dff.loc[1:, engine.ASSETS + [engine.INFLATION]].to_numpy(),
+        "weights": engine.allocation_weights(stocks, cash, corp_bonds),
+        "rebalance": rebalance,
+        "records": make_records(dff),
+        "figure": make_line_chart(dff).to_plotly_json(),
+        "summary_table": make_summary_table(dff),
+    }
+    payload = [results["records"], results["figure"], results["summary_table"]]
+    nbytes = results["returns"].nbytes + len(to_json_plotly(payload))
+    return results, nbytes
+
+
+@metrics.timed("records")
+def make_records(dff):
+    """DataTable rows of the backtest"""
+    return dff[df.columns].to_dict("records")
+
+
+def totals_results(
+    stocks,
+    cash,
+    start_bal,
+    planning_time,
+    start_yr,
+    corp_bonds=0,
+    rebalance="annual",
+    contribution=0,
+    withdrawal=0,
+):
+    """returns the cached results for the inputs, making them on a miss, and
+    the dollar columns for the starting balance and cash flows
+    """
+
+    key = (stocks, cash, corp_bonds, planning_time, start_yr, rebalance)
+    results = results_cache.get(key)
+    if results is None:
+        dff = backtest(
+            stocks, cash, start_bal, planning_time, start_yr, corp_bonds, rebalance
+        )
+        results, nbytes = make_results(dff, stocks, cash, corp_bonds, rebalance)
+        results_cache.put(key, results, nbytes)
+    return results, scale_results(results, start_bal, contribution, withdrawal)
+
+
+def scale_results(results, start_bal, contribution=0, withdrawal=0):
+    """returns the dollar columns of cached results for the starting balance
+    and cash flows"""
+
+    columns = portfolio_columns(
+        results["returns"],
+        results["weights"],
+        start_bal,
+        results["rebalance"],
+        contribution,
+        withdrawal,
+    )
+    return {col: values.tolist() for col, values in columns.items()}
+
+
+def pinned_label(stocks, cash, corp_bonds=0):
+    bonds = 100 - stocks - cash - corp_bonds
+    label = f"{stocks}% Stocks, {bonds}% Bonds, {cash}% Cash"
+    return label + (f", {corp_bonds}% Corp Bonds" if corp_bonds else "")
+
+
+def compare_portfolios(
+    results, pinned, start_yr, start_bal, contribution=0, withdrawal=0
+):
+    """balances of the pinned portfolios over the period of the cached
+    results, which starts in start_yr, with the same rebalancing and cash
+    flows as My Portfolio, and their returns without the cash flows.  Every
+    pinned portfolio is evaluated in one pass of the engine.  Returns the
+    balances rounded to dollars (years + 1, portfolios) and a dataframe from
+    pinned_stats()
+    """
+
+    returns = results["returns"]
+    weights = np.array([engine.allocation_weights(*portfolio) for portfolio in pinned])
+    flows = None
+    if contribution or withdrawal:
+        # the same portfolios again with the cash flows, in the same pass
+        weights = np.vstack([weights, weights])
+        flows = np.zeros((len(returns), len(weights)))
+        flows[:, len(pinned) :] = engine.cash_flows(
+            returns[:, -1], contribution, withdrawal / 100 * start_bal
+        )[:, None]
+    balances = engine.portfolio_balances(
+        returns[:, : len(engine.ASSETS)],
+        weights,
+        start_bal,
+        **REBALANCING[results["rebalance"]][1],
+        flows=flows,
+    )
+    stats = pinned_stats(balances[:, : len(pinned)], pinned, start_yr)
+    return balances[:, -len(pinned) :].round(0), stats
+
+
+def pinned_stats(balances, pinned, start_yr):
+    """CAGR and worst 1 year return of each pinned portfolio from its
+    balances without cash flows, in a dataframe for make_summary_table()"""
+
+    annual_returns = balances[1:] / balances[:-1] - 1
+    worst_row = annual_returns.argmin(axis=0)
+    return pd.DataFrame(
+        {
+            "Portfolio": [pinned_label(*portfolio) for portfolio in pinned],
+            "CAGR": (balances[-1] / balances[0]) ** (1 / len(annual_returns)) - 1,
+            "Worst": annual_returns[worst_row, np.arange(len(pinned))],
+            "Worst Year": start_yr + worst_row,
+        }
+    )
+
+
+def results_records(results, columns):
+    """DataTable rows of the cached results with the dollar columns"""
+
+    return [
+        dict(row, **{col: values[i] for col, values in columns.items()})
+        for i, row in enumerate(results["records"])
+    ]
+
+
+def results_figure(results, columns):
+    """line chart figure of the cached results with the dollar columns"""
+
+    figure = results["figure"]
+    return dict(
+        figure,
+        data=[
+            dict(trace, y=columns[col])
+            for trace, col in zip(figure["data"], LINE_CHART_COLUMNS)
+        ],
+    )
+
 
-    start_bal = dff.iat[0]
-    end_bal = dff.iat[-1]
-    planning_time = len(dff) - 1
-    cagr_result = ((end_bal / start_bal) ** (1 / planning_time)) - 1
-    return f"{cagr_result:.1%}"
+def patch_line_chart(columns, changed):
+    """partial update of the make_line_chart figure with new values of the
+    changed columns"""
 
+    patch = Patch()
+    for i, col in enumerate(LINE_CHART_COLUMNS):
+        if col in changed:
+            patch["data"][i]["y"] = columns[col]
+    return patch
 
-def worst(dff, asset):
-    """calculate worst returns for asset in selected period returns formated string"""
 
-    worst_yr_loss = min(dff[asset])
-    worst_yr = dff.loc[dff[asset] == worst_yr_loss, "Year"].iloc[0]
-    return f"{worst_yr_loss:.1%} in {worst_yr}"
+def rolling_periods(stocks, cash, nper, corp_bonds=0, rebalance="annual"):
+    """calculates the CAGR of My Portfolio and inflation for every period of
+    nper years in the data and returns a dataframe
+    """
+
+    weights = np.zeros((2, RETURNS.shape[1]))
+    weights[0, :-1] = engine.allocation_weights(stocks, cash, corp_bonds)
+    weights[1, -1] = 1
+    growth = engine.rolling_growth(engine.rebalanced_growth(RETURNS, weights), nper)
+    if rebalance != "annual":
+        # My Portfolio rebalanced by the policy over all the periods at once
+        windows = engine.window_returns(RETURNS[:, :-1], nper)
+        holdings, _ = engine.rebalance_paths(
+            windows,
+            np.broadcast_to(weights[0, :-1], (windows.shape[1], weights.shape[1] - 1)),
+            **REBALANCING[rebalance][1],
+        )
+        growth[:, 0] = holdings[-1].sum(axis=1)
+    rolling_cagr = growth ** (1 / nper) - 1
+
+    start = np.arange(MIN_YR, MIN_YR + len(growth))
+    return pd.DataFrame(
+        {
+            "Start": start,
+            "End": start + nper - 1,
+            "CAGR": rolling_cagr[:, 0],
+            "Inflation": rolling_cagr[:, 1],
+        }
+    )
+
+
+def period_cagr_grid(stocks, cash, corp_bonds=0):
+    """CAGR of My Portfolio, rebalanced annually, for every start year and
+    number of years in an array (start years x years), from one growth path
+    """
+
+    weights = engine.allocation_weights(stocks, cash, corp_bonds)
+    growth = engine.rebalanced_growth(RETURNS[:, :-1], weights[None])
+    return engine.period_cagrs(growth[:, 0])
+
+
+def make_rolling_summary(dff):
+    """Make html table to show the distribution of CAGR over every period"""
+
+    def period(i):
+        return f"{dff['CAGR'].iat[i]:.1%} from {dff['Start'].iat[i]} to {dff['End'].iat[i]}"
+
+    percentiles = dff["CAGR"].quantile([0.1, 0.5, 0.9])
+    beat_inflation = (dff["CAGR"] > dff["Inflation"]).mean()
+    df_table = pd.DataFrame(
+        {
+            "": [
+                "Number of periods",
+                "Best",
+                "Worst",
+                "Median",
+                "10th - 90th percentile",
+                "Beat inflation",
+            ],
+            "My Portfolio CAGR": [
+                len(dff),
+                period(dff["CAGR"].argmax()),
+                period(dff["CAGR"].argmin()),
+                f"{percentiles[0.5]:.1%}",
+                f"{percentiles[0.1]:.1%} to {percentiles[0.9]:.1%}",
+                f"{beat_inflation:.0%} of periods",
+            ],
+        }
+    )
+    return dbc.Table.from_dataframe(df_table, bordered=True, hover=True)
+
+
+def withdrawal_periods(stocks, cash, nper, corp_bonds=0, rebalance="annual"):
+    """calculates the highest withdrawal rate that lasted every period of nper
+    years in the data and returns a dataframe
+    """
+
+    rates = engine.safe_withdrawal_rates(
+        RETURNS[:, :-1],
+        RETURNS[:, -1],
+        engine.allocation_weights(stocks, cash, corp_bonds),
+        nper,
+        **REBALANCING[rebalance][1],
+    )
+    start = np.arange(MIN_YR, MIN_YR + len(rates))
+    return pd.DataFrame({"Start": start, "End": start + nper - 1, "Rate": rates})
+
+
+def make_withdrawal_summary(dff):
+    """Make html table to show the safe withdrawal rate and the distribution
+    of the highest rate over every period"""
+
+    def period(i):
+        # round down so a rate that ran out is never shown
+        rate = np.floor(dff["Rate"].iat[i] * 1000) / 1000
+        return f"{rate:.1%} from {dff['Start'].iat[i]} to {dff['End'].iat[i]}"
+
+    df_table = pd.DataFrame(
+        {
+            "": ["Safe withdrawal rate (worst period)", "Median period", "Best period"],
+            "Highest Withdrawal Rate": [
+                period(dff["Rate"].argmin()),
+                f"{np.floor(dff['Rate'].median() * 1000) / 1000:.1%}",
+                period(dff["Rate"].argmax()),
+            ],
+        }
+    )
+    return dbc.Table.from_dataframe(df_table, bordered=True, hover=True)
+
+
+def risk_stats(
+    stocks, cash, planning_time, start_yr, corp_bonds=0, rebalance="annual"
+):
+    """calculates the risk metrics of My Portfolio and each single asset over
+    the period, with the 3 month T.Bill as the risk free rate, and returns a
+    dataframe with one row each
+    """
+
+    returns = period_returns(planning_time, start_yr)
+    weights = np.vstack(
+        [
+            engine.allocation_weights(stocks, cash, corp_bonds),
+            np.eye(len(engine.ASSETS)),
+        ]
+    )
+    portfolio_returns = returns[:, :-1] @ weights.T
+    if rebalance != "annual":
+        holdings, _ = engine.rebalance_paths(
+            returns[:, :-1], weights[:1], **REBALANCING[rebalance][1]
+        )
+        totals = holdings[:, 0].sum(axis=1)
+        portfolio_returns[:, 0] = totals[1:] / totals[:-1] - 1
+    stats = engine.series_risk_metrics(
+        portfolio_returns, returns[:, engine.ASSETS.index(engine.CASH)]
+    )
+
+    # row 0 of the growth paths is the balance at the end of the year before
+    def years(rows):
+        return np.where(rows < 0, -1, start_yr - 1 + rows)
+
+    return pd.DataFrame(
+        {
+            "Volatility": stats["volatility"],
+            "Max Drawdown": stats["max_drawdown"],
+            "Peak": years(stats["peak_row"]),
+            "Trough": years(stats["trough_row"]),
+            "Recovery": years(stats["recovery_row"]),
+            "Sharpe": stats["sharpe"],
+            "Sortino": stats["sortino"],
+        },
+        index=["My Portfolio"] + ASSET_COLUMNS,
+    )
+
+
+def make_risk_table(dff, end_yr):
+    """Make html table to show the risk metrics of risk_stats()"""
+
+    def drawdown(row):
+        if row["Max Drawdown"] == 0:
+            return "None"
+        return f"{row['Max Drawdown']:.1%} from {row['Peak']} to {row['Trough']}"
+
+    def recovery(row):
+        if row["Max Drawdown"] == 0:
+            return ""
+        if row["Recovery"] < 0:
+            return f"Not by {end_yr}"
+        years = row["Recovery"] - row["Trough"]
+        return f"{years} year{'' if years == 1 else 's'}, in {row['Recovery']}"
+
+    def ratio(value):
+        return f"{value:.2f}" if np.isfinite(value) else "n/a"
+
+    # the years as ints, iterrows() would make every value of a row a float
+    rows = dff.to_dict("records")
+    for row in rows:
+        for col in ["Peak", "Trough", "Recovery"]:
+            row[col] = int(row[col])
+    df_table = pd.DataFrame(
+        {
+            "": dff.index,
+            "Volatility": [f"{row['Volatility']:.1%}" for row in rows],
+            "Max Drawdown": [drawdown(row) for row in rows],
+            "Recovery": [recovery(row) for row in rows],
+            "Sharpe Ratio": [ratio(row["Sharpe"]) for row in rows],
+            "Sortino Ratio": [ratio(row["Sortino"]) for row in rows],
+        }
+    )
+    return dbc.Table.from_dataframe(df_table, bordered=True, hover=True)
 
 
 """
@@ -592,39 +1873,61 @@ def worst(dff, asset):
 Main Layout
 """
 
-app.layout = dbc.Container(
-    [
-        dbc.Row(
-            dbc.Col(
-                html.H2(
-                    "Asset Allocation Visualizer",
-                    className="text-center bg-primary text-white p-2",
-                ),
-            )
-        ),
-        dbc.Row(
-            [
-                dbc.Col(tabs, width=12, lg=5, className="mt-4 border"),
+
+def make_layout(pie_template):
+    return dbc.Container(
+        [
+            dbc.Row(
                 dbc.Col(
-                    [
-                        dcc.Graph(id="allocation_pie_chart", className="mb-2"),
-                        dcc.Graph(id="returns_chart", className="pb-4"),
-                        html.Hr(),
-                        html.Div(id="summary_table"),
-                        html.H6(datasource_text, className="my-2"),
-                    ],
-                    width=12,
-                    lg=7,
-                    className="pt-4",
-                ),
-            ],
-            className="ms-1",
-        ),
-        dbc.Row(dbc.Col(footer)),
-        dbc.Row(dbc.Col(about.card, width="auto"), justify="center")
-    ],
-    fluid=True,
-)
+                    html.H2(
+                        "Asset Allocation Visualizer",
+                        className="text-center bg-primary text-white p-2",
+                    ),
+                )
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(tabs, width=12, lg=5, className="mt-4 border"),
+                    dbc.Col(
+                        [
+                            dcc.Graph(id="allocation_pie_chart", className="mb-2"),
+                            dcc.Store(
+                                id="pie_template",
+                                data=pie_template,
+                            ),
+                            dcc.Graph(id="returns_chart", className="pb-4"),
+                            simulation_card,
+                            html.Hr(),
+                            html.Div(id="summary_table"),
+                            html.Div(id="risk_table"),
+                            html.H6(datasource_text, className="my-2"),
+                        ],
+                        width=12,
+                        lg=7,
+                        className="pt-4",
+                    ),
+                ],
+                className="ms-1",
+            ),
+            dbc.Row(dbc.Col(footer)),
+            dbc.Row(dbc.Col(about.card, width="auto"), justify="center")
+        ],
+        fluid=True,
+    )
+
+
+@functools.cache
+def serve_layout():
+    """builds the layout on the first page load rather than at import, so
+    workers start without making the pie chart template
+    """
+    return make_layout(pie_template())
+
+
+# Dash checks the callbacks against this layout instead of calling
+# serve_layout() when the layout is set
+app.validation_layout = make_layout(None)
+app.layout = serve_layout
 
 
 """
@@ -633,14 +1936,18 @@ Callbacks
 """
 
 
-@app.callback(
-    Output("allocation_pie_chart", "figure"),
-    Input("stock_bond", "value"),
-    Input("cash", "value"),
-)
-def update_pie(stocks, cash):
-    bonds = 100 - stocks - cash
-    slider_input = [cash, bonds, stocks]
+@functools.cache
+def pie_template():
+    """the make_pie() figure as JSON data, for making the pie chart of any
+    allocation by replacing the values and title"""
+    return json.loads(to_json_plotly(make_pie([1, 1, 1, 1], "")))
+
+
+def pie_figure(template, stocks, cash, corp_bonds):
+    """pie chart of the allocation made from the template, same as
+    update_pie() in assets/clientside.js"""
+
+    bonds = 100 - stocks - cash - corp_bonds
 
     if stocks >= 70:
         investment_style = "Aggressive"
@@ -648,20 +1955,44 @@ def update_pie(stocks, cash):
         investment_style = "Conservative"
     else:
         investment_style = "Moderate"
-    figure = make_pie(slider_input, investment_style + " Asset Allocation")
+    return dict(
+        template,
+        data=[dict(template["data"][0], values=[cash, bonds, stocks, corp_bonds])],
+        layout=dict(
+            template["layout"],
+            title=dict(
+                template["layout"]["title"],
+                text=investment_style + " Asset Allocation",
+            ),
+        ),
+    )
+
+
+@functools.cache
+def pie_figures():
+    """pie chart figure for every slider position, made once on first use"""
+
+    template = pie_template()
+    return {
+        (stocks, cash, corp_bonds): pie_figure(template, stocks, cash, corp_bonds)
+        for cash in range(0, 101, 5)
+        for corp_bonds in range(0, 101 - cash, 5)
+        for stocks in range(0, 101 - cash - corp_bonds, 5)
+    }
+
+
+def update_pie(stocks, cash, corp_bonds):
+    figure = pie_figures().get((stocks, cash, corp_bonds))
+    if figure is None:
+        figure = pie_figure(pie_template(), stocks, cash, corp_bonds)
     return figure
 
 
-@app.callback(
-    Output("stock_bond", "max"),
-    Output("stock_bond", "marks"),
-    Output("stock_bond", "value"),
-    Input("cash", "value"),
-    State("stock_bond", "value"),
-)
-def update_stock_slider(cash, initial_stock_value):
-    max_slider = 100 - int(cash)
-    stocks = min(max_slider, initial_stock_value)
+def slider_range(max_slider, initial_value):
+    """max, marks and value of a slider limited to what is left of the
+    allocation"""
+
+    value = min(max_slider, initial_value)
 
     # formats the slider scale
     if max_slider > 50:
@@ -670,7 +2001,64 @@ def update_stock_slider(cash, initial_stock_value):
         marks_slider = {i: f"{i}%" for i in range(0, max_slider + 1, 1)}
     else:
         marks_slider = {i: f"{i}%" for i in range(0, max_slider + 1, 5)}
-    return max_slider, marks_slider, stocks
+    return max_slider, marks_slider, value
+
+
+def update_corp_bond_slider(cash, initial_corp_bond_value):
+    return slider_range(100 - int(cash), initial_corp_bond_value)
+
+
+def update_stock_slider(cash, corp_bonds, initial_stock_value):
+    return slider_range(100 - int(cash) - int(corp_bonds), initial_stock_value)
+
+
+# The pie chart and sliders only depend on the slider values, so they run in
+# the browser (assets/clientside.js).  The Python versions above are used
+# instead when CLIENTSIDE_CALLBACKS=off.
+CLIENTSIDE_CALLBACKS = os.environ.get("CLIENTSIDE_CALLBACKS", "on") != "off"
+
+pie_dependencies = [
+    Output("allocation_pie_chart", "figure"),
+    Input("stock_bond", "value"),
+    Input("cash", "value"),
+    Input("corp_bonds", "value"),
+]
+corp_bond_slider_dependencies = [
+    Output("corp_bonds", "max"),
+    Output("corp_bonds", "marks"),
+    Output("corp_bonds", "value"),
+    Input("cash", "value"),
+    State("corp_bonds", "value"),
+]
+stock_slider_dependencies = [
+    Output("stock_bond", "max"),
+    Output("stock_bond", "marks"),
+    Output("stock_bond", "value"),
+    Input("cash", "value"),
+    Input("corp_bonds", "value"),
+    State("stock_bond", "value"),
+]
+
+if CLIENTSIDE_CALLBACKS:
+    app.clientside_callback(
+        ClientsideFunction(namespace="allocation", function_name="update_pie"),
+        *pie_dependencies,
+        State("pie_template", "data"),
+    )
+    app.clientside_callback(
+        ClientsideFunction(
+            namespace="allocation", function_name="update_corp_bond_slider"
+        ),
+        *corp_bond_slider_dependencies,
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace="allocation", function_name="update_stock_slider"),
+        *stock_slider_dependencies,
+    )
+else:
+    app.callback(*pie_dependencies)(update_pie)
+    app.callback(*corp_bond_slider_dependencies)(update_corp_bond_slider)
+    app.callback(*stock_slider_dependencies)(update_stock_slider)
 
 
 @app.callback(
@@ -680,8 +2068,9 @@ def update_stock_slider(cash, initial_stock_value):
     Input("planning_time", "value"),
     Input("start_yr", "value"),
     Input("time_period", "value"),
+    Input("cagr_heatmap", "clickData"),
 )
-def update_time_period(planning_time, start_yr, period_number):
+def update_time_period(planning_time, start_yr, period_number, heatmap_click):
     """syncs inputs and selected time periods"""
     ctx = callback_context
     input_id = ctx.triggered[0]["prop_id"].split(".")[0]
@@ -690,54 +2079,450 @@ def update_time_period(planning_time, start_yr, period_number):
         planning_time = time_period_data[period_number]["planning_time"]
         start_yr = time_period_data[period_number]["start_yr"]
 
-    if input_id in ["planning_time", "start_yr"]:
+    if input_id == "cagr_heatmap":
+        point = heatmap_click["points"][0]
+        if point.get("z") is None:  # empty cells of periods past MAX_YR
+            return no_update, no_update, no_update
+        planning_time, start_yr = point["y"], point["x"]
+
+    if input_id in ["planning_time", "start_yr", "cagr_heatmap"]:
         period_number = None
 
     return planning_time, start_yr, period_number
 
 
 @app.callback(
-    Output("total_returns", "data"),
+    Output("pinned", "data"),
+    Input("pin_portfolio", "n_clicks"),
+    Input("clear_pinned", "n_clicks"),
+    State("stock_bond", "value"),
+    State("cash", "value"),
+    State("corp_bonds", "value"),
+    State("pinned", "data"),
+    prevent_initial_call=True,
+)
+def update_pinned(pin_clicks, clear_clicks, stocks, cash, corp_bonds, pinned):
+    """pins the current allocation, replacing the oldest after MAX_PINNED"""
+    ctx = callback_context
+    input_id = ctx.triggered[0]["prop_id"].split(".")[0]
+
+    if input_id == "clear_pinned":
+        return []
+    portfolio = [stocks, cash, corp_bonds or 0]
+    if portfolio in pinned:
+        return no_update
+    return (pinned + [portfolio])[-MAX_PINNED:]
+
+
+@app.callback(
     Output("returns_chart", "figure"),
     Output("summary_table", "children"),
     Output("ending_amount", "value"),
     Output("cagr", "value"),
     Input("stock_bond", "value"),
     Input("cash", "value"),
+    Input("corp_bonds", "value"),
     Input("starting_amount", "value"),
     Input("planning_time", "value"),
     Input("start_yr", "value"),
+    Input("rebalance", "value"),
+    Input("contribution", "value"),
+    Input("withdrawal", "value"),
+    Input("pinned", "data"),
 )
-def update_totals(stocks, cash, start_bal, planning_time, start_yr):
+def update_totals(
+    stocks,
+    cash,
+    corp_bonds,
+    start_bal,
+    planning_time,
+    start_yr,
+    rebalance,
+    contribution,
+    withdrawal,
+    pinned,
+):
     # set defaults for invalid inputs
     start_bal = 10 if start_bal is None else start_bal
+    contribution = contribution or 0
+    withdrawal = withdrawal or 0
+    pinned = pinned or []
+    planning_time, start_yr = valid_period(planning_time, start_yr)
+
+    results, columns = totals_results(
+        stocks,
+        cash,
+        start_bal,
+        planning_time,
+        start_yr,
+        corp_bonds,
+        rebalance,
+        contribution,
+        withdrawal,
+    )
+    summary_table = results["summary_table"]
+
+    # When the period is the same, only send the parts of the figure that
+    # changed.  The allocation only changes My Portfolio, the rebalancing and
+    # cash flows also change the pinned portfolios and the starting amount
+    # changes every balance.  The summary table only changes with the period,
+    # or the rebalancing of pinned portfolios.
+    changed = {prop_id.split(".")[0] for prop_id in callback_context.triggered_prop_ids}
+    full_figure = not changed or changed & {"planning_time", "start_yr", "pinned"}
+    if pinned and (full_figure or changed - {"stock_bond", "cash", "corp_bonds"}):
+        pinned_balances, stats = compare_portfolios(
+            results, pinned, start_yr, start_bal, contribution, withdrawal
+        )
+
+    if not full_figure:
+        if "starting_amount" in changed:
+            fig = patch_line_chart(columns, LINE_CHART_COLUMNS)
+        else:
+            fig = patch_line_chart(columns, ["Total"])
+        if pinned and changed - {"stock_bond", "cash", "corp_bonds"}:
+            for i, balances in enumerate(pinned_balances.T):
+                fig["data"][len(LINE_CHART_COLUMNS) + i]["y"] = balances.tolist()
+        summary_table = no_update
+        if pinned and "rebalance" in changed:
+            summary_table = add_pinned_rows(results["summary_table"], stats)
+    else:
+        fig = results_figure(results, columns)
+        if pinned:
+            fig["data"] += make_pinned_traces(
+                fig["data"][0]["x"], pinned_balances, stats["Portfolio"]
+            )
+            summary_table = add_pinned_rows(summary_table, stats)
+
+    if (
+        corp_bonds == 0
+        and rebalance == "annual"
+        and (cash, stocks) in grid.ALLOCATION_INDEX
+    ):
+        # look up ending balance and cagr in the precomputed results
+        ending, ending_cagr = result_grid.lookup(stocks, cash, start_yr, planning_time)
+        ending_amount = f"${start_bal * ending:0,.0f}"
+        ending_cagr = f"{ending_cagr:.1%}"
+    else:
+        # The rate of return of the investments, which the cash flows don't
+        # change since they are added and taken in proportion to the holdings.
+        # From the growth of $1, not the dollar rounded totals, like the grid
+        growth = engine.portfolio_balances(
+            results["returns"][:, : len(engine.ASSETS)],
+            results["weights"][None, :],
+            **REBALANCING[rebalance][1],
+        )[-1, 0]
+        ending_amount = f"${start_bal * growth:0,.0f}"
+        ending_cagr = f"{growth ** (1 / planning_time) - 1:.1%}"
+
+    if contribution or withdrawal:
+        totals = np.array(columns["Total"])
+        ending_amount = f"${totals[-1]:0,.0f}"
+        if totals[-1] <= 0:
+            ran_out = np.flatnonzero(totals[1:] <= 0)[0]
+            ending_amount += f", ran out in {start_yr + ran_out}"
+
+    return fig, summary_table, ending_amount, ending_cagr
+
+
+@app.callback(
+    Output("total_returns", "data"),
+    Output("total_returns", "page_count"),
+    Output("total_returns", "page_current"),
+    Input("stock_bond", "value"),
+    Input("cash", "value"),
+    Input("corp_bonds", "value"),
+    Input("starting_amount", "value"),
+    Input("planning_time", "value"),
+    Input("start_yr", "value"),
+    Input("rebalance", "value"),
+    Input("contribution", "value"),
+    Input("withdrawal", "value"),
+    Input("total_returns", "page_current"),
+    Input("total_returns", "page_size"),
+    Input("total_returns", "sort_by"),
+)
+def update_total_returns_page(
+    stocks,
+    cash,
+    corp_bonds,
+    start_bal,
+    planning_time,
+    start_yr,
+    rebalance,
+    contribution,
+    withdrawal,
+    page_current,
+    page_size,
+    sort_by,
+):
+    start_bal = 10 if start_bal is None else start_bal
+    planning_time, start_yr = valid_period(planning_time, start_yr)
+
+    results, columns = totals_results(
+        stocks,
+        cash,
+        start_bal,
+        planning_time,
+        start_yr,
+        corp_bonds,
+        rebalance,
+        contribution or 0,
+        withdrawal or 0,
+    )
+    rows = results_records(results, columns)
+    return table_page(
+        rows, page_current, page_size, sort_by, total_returns_table.columns
+    )
+
+
+@app.callback(
+    Output("annual_returns_pct", "data"),
+    Input("annual_returns_pct", "page_current"),
+    Input("annual_returns_pct", "page_size"),
+    Input("annual_returns_pct", "sort_by"),
+)
+def update_annual_returns_page(page_current, page_size, sort_by):
+    page, _, _ = table_page(
+        annual_returns_records(),
+        page_current,
+        page_size,
+        sort_by,
+        annual_returns_pct_table.columns,
+    )
+    return page
+
+
+@app.callback(
+    Output("rolling_chart", "figure"),
+    Output("rolling_summary", "children"),
+    Input("stock_bond", "value"),
+    Input("cash", "value"),
+    Input("corp_bonds", "value"),
+    Input("planning_time", "value"),
+    Input("rebalance", "value"),
+    Input("tabs", "active_tab"),
+)
+def update_rolling(stocks, cash, corp_bonds, planning_time, rebalance, active_tab):
+    # only drawn while its tab shows, switching to the tab updates it
+    if active_tab != "tab-4":
+        return no_update, no_update
     planning_time = 1 if planning_time is None else planning_time
-    start_yr = MIN_YR if start_yr is None else int(start_yr)
+    planning_time = min(max(planning_time, 1), MAX_YR - MIN_YR + 1)
+
+    dff = rolling_periods(stocks, cash, planning_time, corp_bonds, rebalance)
+    return make_rolling_chart(dff), make_rolling_summary(dff)
+
+
+@app.callback(
+    Output("cagr_heatmap", "figure"),
+    Input("stock_bond", "value"),
+    Input("cash", "value"),
+    Input("corp_bonds", "value"),
+    Input("planning_time", "value"),
+    Input("start_yr", "value"),
+    Input("tabs", "active_tab"),
+)
+def update_heatmap(stocks, cash, corp_bonds, planning_time, start_yr, active_tab):
+    if active_tab != "tab-4":
+        return no_update
+    planning_time, start_yr = valid_period(planning_time, start_yr)
+    cagrs = period_cagr_grid(stocks, cash, corp_bonds)
+    return make_cagr_heatmap(cagrs, planning_time, start_yr)
+
+
+@app.callback(
+    Output("withdrawal_summary", "children"),
+    Input("stock_bond", "value"),
+    Input("cash", "value"),
+    Input("corp_bonds", "value"),
+    Input("planning_time", "value"),
+    Input("rebalance", "value"),
+    Input("tabs", "active_tab"),
+)
+def update_withdrawal(stocks, cash, corp_bonds, planning_time, rebalance, active_tab):
+    if active_tab != "tab-4":
+        return no_update
+    planning_time = 1 if planning_time is None else planning_time
+    planning_time = min(max(planning_time, 1), MAX_YR - MIN_YR + 1)
+
+    dff = withdrawal_periods(stocks, cash, planning_time, corp_bonds, rebalance)
+    return make_withdrawal_summary(dff)
+
+
+# the start amount is not an input, the simulation is of the growth of $1 and
+# update_simulation_chart() scales it, so typing an amount doesn't rerun it
+simulation_dependencies = [
+    Output("simulation_results", "data"),
+    Input("stock_bond", "value"),
+    Input("cash", "value"),
+    Input("corp_bonds", "value"),
+    Input("planning_time", "value"),
+    Input("simulation_method", "value"),
+    Input("simulation_paths", "value"),
+]
+
+
+def update_simulation(
+    stocks, cash, corp_bonds, planning_time, method, paths, progress=None
+):
+    # as long as the data at most, which also bounds the memory per chunk
+    planning_time = 1 if planning_time is None else int(planning_time)
+    planning_time = min(max(planning_time, 1), MAX_YR - MIN_YR + 1)
+    paths = int(paths)
+
+    returns = RETURNS[:, :-1] @ engine.allocation_weights(stocks, cash, corp_bonds)
+    percentiles = simulate.simulate(
+        returns,
+        planning_time,
+        paths,
+        block=5 if method == "block" else 1,
+        progress=progress,
+    )
+    return {
+        "percentiles": percentiles.tolist(),
+        "paths": paths,
+        "method": simulation_methods[method],
+    }
+
+
+if BACKGROUND_CALLBACKS:
+
+    @app.callback(
+        *simulation_dependencies,
+        background=True,
+        manager=job_manager,
+        progress=[
+            Output("simulation_progress", "value"),
+            Output("simulation_progress", "label"),
+        ],
+        running=[
+            (
+                Output("simulation_running", "style"),
+                {"display": "flex"},
+                {"display": "none"},
+            ),
+            (Output("simulation_paths", "disabled"), True, False),
+        ],
+        cancel=[Input("cancel_simulation", "n_clicks")],
+    )
+    def update_simulation_job(set_progress, *args):
+        def progress(done, total):
+            set_progress((100 * done / total, f"{done:,} of {total:,} paths"))
+
+        return update_simulation(*args, progress=progress)
+
+else:
+    app.callback(*simulation_dependencies)(update_simulation)
+
+
+@app.callback(
+    Output("simulation_chart", "figure"),
+    Input("simulation_results", "data"),
+    Input("starting_amount", "value"),
+)
+def update_simulation_chart(results, start_bal):
+    if results is None:
+        return no_update
+    start_bal = 10 if start_bal is None else start_bal
+    return make_simulation_chart(
+        np.array(results["percentiles"]),
+        start_bal,
+        results["paths"],
+        results["method"],
+    )
+
+
+@app.callback(
+    Output("frontier_chart", "figure"),
+    Input("stock_bond", "value"),
+    Input("cash", "value"),
+    Input("corp_bonds", "value"),
+    Input("planning_time", "value"),
+    Input("start_yr", "value"),
+    Input("frontier_risk", "value"),
+    Input("tabs", "active_tab"),
+)
+def update_frontier(
+    stocks, cash, corp_bonds, planning_time, start_yr, risk, active_tab
+):
+    if active_tab != "tab-5":
+        return no_update
+    planning_time, start_yr = valid_period(planning_time, start_yr)
+    dff = allocation_sweep(stocks, cash, planning_time, start_yr, corp_bonds)
+    return make_frontier_chart(dff, risk)
+
+
+@app.callback(
+    Output("risk_table", "children"),
+    Input("stock_bond", "value"),
+    Input("cash", "value"),
+    Input("corp_bonds", "value"),
+    Input("planning_time", "value"),
+    Input("start_yr", "value"),
+    Input("rebalance", "value"),
+)
+def update_risk_table(stocks, cash, corp_bonds, planning_time, start_yr, rebalance):
+    planning_time, start_yr = valid_period(planning_time, start_yr)
+    dff = risk_stats(stocks, cash, planning_time, start_yr, corp_bonds, rebalance)
+    return make_risk_table(dff, start_yr + planning_time - 1)
+
+
+@app.callback(
+    Output("cash", "value", allow_duplicate=True),
+    Output("stock_bond", "value", allow_duplicate=True),
+    Output("corp_bonds", "value", allow_duplicate=True),
+    Output("optimizer_results", "children"),
+    Input("optimize", "n_clicks"),
+    State("optimizer_max_loss", "value"),
+    State("optimizer_max_drawdown", "value"),
+    State("planning_time", "value"),
+    State("start_yr", "value"),
+    prevent_initial_call=True,
+)
+def update_optimizer(n_clicks, max_loss, max_drawdown, planning_time, start_yr):
+    """sets the sliders to the best allocation on the slider grid within the
+    losses"""
+
+    planning_time, start_yr = valid_period(planning_time, start_yr)
+    dff = best_allocations(planning_time, start_yr, max_loss, max_drawdown)
+    if dff.empty:
+        message = dbc.Alert(
+            "No allocation stays within these losses, try larger limits.",
+            color="warning",
+        )
+        return no_update, no_update, no_update, message
+
+    best = dff.iloc[0]
+    return (
+        int(best["Cash"]),
+        int(best["Stocks"]),
+        int(best["Corp Bonds"]),
+        [
+            make_optimizer_table(dff),
+            dbc.FormText("Rebalanced annually, whatever the rebalancing chosen"),
+        ],
+    )
 
-    # calculate valid planning time start yr
-    max_time = MAX_YR + 1 - start_yr
-    planning_time = min(max_time, planning_time)
-    if start_yr + planning_time > MAX_YR:
-        start_yr = min(df.iloc[-planning_time, 0], MAX_YR)  # 0 is Year column
 
-    # create investment returns dataframe
-    dff = backtest(stocks, cash, start_bal, planning_time, start_yr)
+@app.server.route("/cache-stats")
+def cache_stats():
+    """hit, miss and eviction counters of the update_totals results cache"""
+    return flask.jsonify(results_cache.stats())
 
-    # create data for DataTable
-    data = dff.to_dict("records")
 
-    # create the line chart
-    fig = make_line_chart(dff)
+if BACKGROUND_CALLBACKS:
 
-    summary_table = make_summary_table(dff)
+    @app.server.route("/jobs-stats")
+    def jobs_stats():
+        """background jobs running, clients waiting for them and results kept"""
+        return flask.jsonify(job_manager.stats())
 
-    # format ending balance
-    ending_amount = f"${dff['Total'].iloc[-1]:0,.0f}"
 
-    # calcluate cagr
-    ending_cagr = cagr(dff["Total"])
+# latency, payload size and error counts per callback on /metrics
+metrics.instrument(app)
 
-    return data, fig, summary_table, ending_amount, ending_cagr
+# POST /api/backtest scores a batch of portfolios
+api.register(app, RETURNS, MIN_YR, MAX_YR)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+// Browser versions of update_pie and the slider callbacks in app.py.  They
+// only depend on the slider values, so they run without a server round trip.
+
+// max, marks and value of a slider limited to what is left of the allocation
+function slider_range(max_slider, initial_value) {
+    const value = Math.min(max_slider, initial_value);
+
+    // formats the slider scale
+    let step;
+    if (max_slider > 50) {
+        step = 10;
+    } else if (max_slider <= 15) {
+        step = 1;
+    } else {
+        step = 5;
+    }
+    const marks_slider = {};
+    for (let i = 0; i <= max_slider; i += step) {
+        marks_slider[i] = i + "%";
+    }
+    return [max_slider, marks_slider, value];
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    allocation: {
+        update_pie: function (stocks, cash, corp_bonds, template) {
+            const bonds = 100 - stocks - cash - corp_bonds;
+
+            let investment_style;
+            if (stocks >= 70) {
+                investment_style = "Aggressive";
+            } else if (stocks <= 30) {
+                investment_style = "Conservative";
+            } else {
+                investment_style = "Moderate";
+            }
+
+            // template is the make_pie() figure, only the values and title change
+            return Object.assign({}, template, {
+                data: [
+                    Object.assign({}, template.data[0], {
+                        values: [cash, bonds, stocks, corp_bonds],
+                    }),
+                ],
+                layout: Object.assign({}, template.layout, {
+                    title: Object.assign({}, template.layout.title, {
+                        text: investment_style + " Asset Allocation",
+                    }),
+                }),
+            });
+        },
+
+        update_corp_bond_slider: function (cash, initial_corp_bond_value) {
+            return slider_range(100 - parseInt(cash), initial_corp_bond_value);
+        },
+
+        update_stock_slider: function (cash, corp_bonds, initial_stock_value) {
+            return slider_range(
+                100 - parseInt(cash) - parseInt(corp_bonds),
+                initial_stock_value
+            );
+        },
+    },
+});
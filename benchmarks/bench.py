@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+==========================================================================
+Benchmarks for the backtest, figure and serialization hot paths
+
+Run from the repository root:
+
+    python -m benchmarks.bench                  compare with the baseline
+    python -m benchmarks.bench --save           store a new baseline
+    python -m benchmarks.bench --threshold 10   fail if 10% slower
+
+Every benchmark runs for a short (1 year), medium (15 years) and full
+(1928 to the last year) period, over a sweep of allocations.  It reports
+the wall time per call (the median over the allocations of the best of
+several rounds), the peak memory allocated by one call and the size of the
+JSON sent to the browser.  The run fails when any median time
+is slower than the stored baseline by more than the threshold.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from plotly.io.json import to_json_plotly
+
+import app
+from benchmarks.callbacks import ENDPOINT, request_body
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+MIN_YR, MAX_YR = int(app.MIN_YR), int(app.MAX_YR)
+PERIODS = {
+    "short": (MAX_YR, 1),
+    "medium": (2007, 15),
+    "full": (MIN_YR, MAX_YR - MIN_YR + 1),
+}
+
+# (cash, stocks) allocations, every benchmark is run for each one
+ALLOCATIONS = [(0, 100), (10, 50), (20, 30), (40, 60), (60, 20), (100, 0)]
+
+START_BAL = 10000
+
+# [stocks, cash, corp_bonds] of the portfolios pinned to compare
+PINNED = [(60, 10, 0), (100, 0, 0), (30, 10, 20)]
+
+# seconds
+MIN_ROUND_TIME = 0.02
+
+
+def json_size(obj):
+    return len(to_json_plotly(obj))
+
+
+def callback(client, name, values, cached):
+    """calls a callback through the Dash endpoint like the browser does"""
+
+    if not cached:
+        app.results_cache.clear()
+    response = client.post(ENDPOINT, json=request_body(name, values))
+    assert response.status_code == 200, response.data[:500]
+    return response.data
+
+
+def make_benchmarks(client):
+    """returns {name: (setup, run, payload)} where setup(stocks, cash, start_yr,
+    planning_time) returns the arguments for run and payload measures the
+    output of run in bytes or is None
+    """
+
+    def backtest_args(stocks, cash, start_yr, planning_time):
+        return stocks, cash, START_BAL, planning_time, start_yr
+
+    def dff_args(stocks, cash, start_yr, planning_time):
+        return (app.backtest(stocks, cash, START_BAL, planning_time, start_yr),)
+
+    def window_args(stocks, cash, start_yr, planning_time):
+        """the summary table's window of the asset"""
+        return "S&P 500", start_yr, start_yr + planning_time - 1
+
+    def totals_values(stocks, cash, start_yr, planning_time):
+        """values of TOTALS_INPUTS, with no corporate bonds or cash flows"""
+        return [stocks, cash, 0, START_BAL, planning_time, start_yr, "annual", 0, 0]
+
+    def totals_args(cached, pinned=()):
+        def setup(stocks, cash, start_yr, planning_time):
+            values = totals_values(stocks, cash, start_yr, planning_time)
+            values.append([list(portfolio) for portfolio in pinned])
+            if cached:
+                callback(client, "update_totals", values, cached=False)
+            return client, "update_totals", values, cached
+
+        return setup
+
+    def rolling_args(rebalance):
+        def setup(stocks, cash, start_yr, planning_time):
+            return stocks, cash, planning_time, 0, rebalance
+
+        return setup
+
+    def page_args(stocks, cash, start_yr, planning_time):
+        values = totals_values(stocks, cash, start_yr, planning_time) + [0, 15, []]
+        return client, "update_total_returns_page", values, True
+
+    return {
+        "backtest": (
+            backtest_args,
+            app.backtest,
+            lambda dff: json_size(dff.to_dict("records")),
+        ),
+        "window_cagr": (window_args, app.window_index.cagr, None),
+        "window_worst": (window_args, app.window_index.worst, None),
+        "make_line_chart": (dff_args, app.make_line_chart, json_size),
+        "make_summary_table": (dff_args, app.make_summary_table, json_size),
+        "update_totals": (totals_args(cached=False), callback, len),
+        "update_totals_cached": (totals_args(cached=True), callback, len),
+        "update_totals_pinned": (
+            totals_args(cached=True, pinned=PINNED),
+            callback,
+            len,
+        ),
+        "update_total_returns_page": (page_args, callback, len),
+        "rolling_periods": (rolling_args("annual"), app.rolling_periods, None),
+        "rolling_periods_band": (rolling_args("band-5"), app.rolling_periods, None),
+        "withdrawal_periods": (rolling_args("annual"), app.withdrawal_periods, None),
+        "best_allocations": (
+            lambda stocks, cash, start_yr, planning_time: (
+                planning_time,
+                start_yr,
+                15,
+                25,
+            ),
+            app.best_allocations,
+            None,
+        ),
+        "period_cagr_grid": (
+            lambda stocks, cash, start_yr, planning_time: (stocks, cash),
+            app.period_cagr_grid,
+            None,
+        ),
+        "make_cagr_heatmap": (
+            lambda stocks, cash, start_yr, planning_time: (
+                app.period_cagr_grid(stocks, cash),
+                planning_time,
+                start_yr,
+            ),
+            app.make_cagr_heatmap,
+            json_size,
+        ),
+    }
+
+
+def time_call(run, args, rounds):
+    """best time per call in ms over rounds, with each round repeating the
+    call for at least MIN_ROUND_TIME seconds and garbage collection off,
+    like timeit
+    """
+
+    gc.disable()
+    number = 1
+    while True:
+        tic = time.perf_counter()
+        for _ in range(number):
+            run(*args)
+        elapsed = time.perf_counter() - tic
+        if elapsed >= MIN_ROUND_TIME:
+            break
+        number *= 2
+
+    best = elapsed / number
+    for _ in range(rounds - 1):
+        tic = time.perf_counter()
+        for _ in range(number):
+            run(*args)
+        best = min(best, (time.perf_counter() - tic) / number)
+    gc.enable()
+    return best * 1000
+
+
+def measure(setup, run, payload, period, rounds):
+    """median over the allocations of the best time per call in ms, peak
+    memory allocated by one call in KiB and payload bytes
+    """
+
+    start_yr, planning_time = PERIODS[period]
+    times = []
+    for cash, stocks in ALLOCATIONS:
+        args = setup(stocks, cash, start_yr, planning_time)
+        times.append(time_call(run, args, rounds))
+
+    tracemalloc.start()
+    result = run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "time_ms": statistics.median(times),
+        "peak_kib": peak / 1024,
+        "payload_bytes": payload(result) if payload else None,
+    }
+
+
+def run_benchmarks(rounds, only=None):
+    client = app.app.server.test_client()
+    client.get("/")
+    results = {}
+    for name, (setup, run, payload) in make_benchmarks(client).items():
+        if only and name not in only:
+            continue
+        for period in PERIODS:
+            key = f"{name}[{period}]"
+            results[key] = measure(setup, run, payload, period, rounds)
+            print_result(key, results[key])
+    return results
+
+
+def print_result(key, result):
+    payload = result["payload_bytes"]
+    print(
+        f"{key:40} {result['time_ms']:9.3f} ms {result['peak_kib']:9.1f} KiB"
+        + ("" if payload is None else f" {payload:8d} bytes")
+    )
+
+
+def compare(results, baseline, threshold):
+    """returns the benchmarks slower than the baseline by more than threshold %,
+    and the benchmarks that are not in the baseline
+    """
+
+    regressions, missing = [], []
+    print(f"\n{'benchmark':40} {'baseline':>12} {'now':>12} {'change':>8}")
+    for key, result in results.items():
+        if key not in baseline:
+            print(f"{key:40} {'-':>12} {result['time_ms']:9.3f} ms  NO BASELINE")
+            missing.append(key)
+            continue
+        before, now = baseline[key]["time_ms"], result["time_ms"]
+        change = (now - before) / before * 100
+        flag = " REGRESSION" if change > threshold else ""
+        print(f"{key:40} {before:9.3f} ms {now:9.3f} ms {change:+7.1f}%{flag}")
+        if change > threshold:
+            regressions.append(key)
+    return regressions, missing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--save", action="store_true", help="store a new baseline")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline json file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=25,
+        help="allowed slow down in percent (default 25)",
+    )
+    parser.add_argument("--rounds", type=int, default=5, help="rounds per allocation")
+    parser.add_argument("--only", nargs="*", help="names of benchmarks to run")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.rounds, args.only)
+
+    if args.save:
+        # --only updates those benchmarks and keeps the rest of the baseline
+        if args.only and os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                results = {**json.load(f), **results}
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nsaved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nno baseline at {args.baseline}, run with --save first")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions, missing = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmarks slower by more than {args.threshold}%")
+    if missing:
+        print(f"\n{len(missing)} benchmarks not in the baseline, run with --save")
+    return 1 if regressions or missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
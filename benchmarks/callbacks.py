@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+==========================================================================
+Request bodies for the Dash callback endpoint, used by the benchmarks and
+the load test to call the app's callbacks the way the browser does
+"""
+
+ENDPOINT = "/_dash-update-component"
+
+TOTALS_INPUTS = [
+    "stock_bond",
+    "cash",
+    "corp_bonds",
+    "starting_amount",
+    "planning_time",
+    "start_yr",
+    "rebalance",
+    "contribution",
+    "withdrawal",
+]
+
+CALLBACKS = {
+    "update_totals": {
+        "outputs": [
+            ("returns_chart", "figure"),
+            ("summary_table", "children"),
+            ("ending_amount", "value"),
+            ("cagr", "value"),
+        ],
+        "inputs": [(id, "value") for id in TOTALS_INPUTS] + [("pinned", "data")],
+    },
+    "update_total_returns_page": {
+        "outputs": [
+            ("total_returns", "data"),
+            ("total_returns", "page_count"),
+            ("total_returns", "page_current"),
+        ],
+        "inputs": [(id, "value") for id in TOTALS_INPUTS]
+        + [
+            ("total_returns", "page_current"),
+            ("total_returns", "page_size"),
+            ("total_returns", "sort_by"),
+        ],
+    },
+    "update_time_period": {
+        "outputs": [
+            ("planning_time", "value"),
+            ("start_yr", "value"),
+            ("time_period", "value"),
+        ],
+        "inputs": [
+            ("planning_time", "value"),
+            ("start_yr", "value"),
+            ("time_period", "value"),
+            ("cagr_heatmap", "clickData"),
+        ],
+    },
+    "update_rolling": {
+        "outputs": [("rolling_chart", "figure"), ("rolling_summary", "children")],
+        "inputs": [
+            (id, "value")
+            for id in [
+                "stock_bond",
+                "cash",
+                "corp_bonds",
+                "planning_time",
+                "rebalance",
+            ]
+        ]
+        + [("tabs", "active_tab")],
+    },
+    "update_frontier": {
+        "outputs": [("frontier_chart", "figure")],
+        "inputs": [
+            (id, "value")
+            for id in [
+                "stock_bond",
+                "cash",
+                "corp_bonds",
+                "planning_time",
+                "start_yr",
+                "frontier_risk",
+            ]
+        ]
+        + [("tabs", "active_tab")],
+    },
+}
+
+
+def request_body(callback, values, changed=()):
+    """body of a callback request with the input values in order and the ids
+    of the inputs that changed, none on the initial call
+    """
+
+    outputs = CALLBACKS[callback]["outputs"]
+    inputs = CALLBACKS[callback]["inputs"]
+    prop_ids = [f"{id}.{prop}" for id, prop in outputs]
+    if len(outputs) == 1:
+        output = prop_ids[0]
+        outputs_body = {"id": outputs[0][0], "property": outputs[0][1]}
+    else:
+        output = ".." + "...".join(prop_ids) + ".."
+        outputs_body = [{"id": id, "property": prop} for id, prop in outputs]
+    return {
+        "output": output,
+        "outputs": outputs_body,
+        "inputs": [
+            {"id": id, "property": prop, "value": value}
+            for (id, prop), value in zip(inputs, values)
+        ],
+        "changedPropIds": [
+            f"{id}.{prop}" for id, prop in inputs if id in changed
+        ],
+    }
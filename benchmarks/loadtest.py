@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+"""
+==========================================================================
+Load test for the Dash callback endpoint
+
+Starts the app on localhost (or uses --url) and runs concurrent virtual
+users.  Each user replays realistic interactions: slider drags, preset time
+period clicks, rebalancing policy changes, pinning portfolios to compare and
+typing into the start year, number of years, start amount and cash flow
+inputs.  Each step fires the server callbacks that the browser would fire
+for the changed inputs, with callbacks whose outputs feed other callbacks
+(like update_time_period) followed by their dependents.
+
+    python -m benchmarks.loadtest --users 20 --duration 30
+
+Reports throughput and p50/p95/p99 latency per callback.  Uses only the
+standard library, all requests go to localhost.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+from benchmarks.callbacks import ENDPOINT
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+"""
+==========================================================================
+App state and callback graph
+"""
+
+
+def collect_props(layout, props=None):
+    """{"id.prop": value} for every component with an id in the layout"""
+
+    props = {} if props is None else props
+    if isinstance(layout, list):
+        for child in layout:
+            collect_props(child, props)
+    elif isinstance(layout, dict):
+        if "props" in layout and "type" in layout:
+            component = layout["props"]
+            if isinstance(component.get("id"), str):
+                for prop, value in component.items():
+                    props[f"{component['id']}.{prop}"] = value
+            for value in component.values():
+                collect_props(value, props)
+    return props
+
+
+def split_prop_ids(output):
+    """prop ids of a callback output key like "..a.b...c.d.." or "a.b" """
+
+    if output.startswith(".."):
+        return output[2:-2].split("...")
+    return [output]
+
+
+class CallbackGraph:
+    """the server callbacks of the app, from /_dash-dependencies"""
+
+    def __init__(self, dependencies):
+        self.callbacks = []
+        for dependency in dependencies:
+            # background callbacks are polled for their results, which the
+            # load test doesn't do
+            if dependency.get("clientside_function") or dependency.get("background"):
+                continue
+            self.callbacks.append(
+                {
+                    "output": dependency["output"],
+                    "outputs": split_prop_ids(dependency["output"]),
+                    "inputs": [
+                        f"{i['id']}.{i['property']}" for i in dependency["inputs"]
+                    ],
+                    "state": [
+                        f"{s['id']}.{s['property']}" for s in dependency["state"]
+                    ],
+                }
+            )
+
+    def triggered(self, changed, source=None):
+        """callbacks with any of the changed prop ids as inputs, except the
+        callback that changed them
+        """
+
+        return [
+            callback
+            for callback in self.callbacks
+            if callback is not source and set(callback["inputs"]) & set(changed)
+        ]
+
+
+def request_body(callback, state, changed):
+    def prop(prop_id):
+        id, name = prop_id.split(".", 1)
+        return {"id": id, "property": name, "value": state.get(prop_id)}
+
+    outputs = [
+        {"id": prop_id.split(".", 1)[0], "property": prop_id.split(".", 1)[1]}
+        for prop_id in callback["outputs"]
+    ]
+    return {
+        "output": callback["output"],
+        "outputs": outputs if callback["output"].startswith("..") else outputs[0],
+        "inputs": [prop(prop_id) for prop_id in callback["inputs"]],
+        "state": [prop(prop_id) for prop_id in callback["state"]],
+        "changedPropIds": [p for p in callback["inputs"] if p in changed],
+    }
+
+
+def callback_name(callback):
+    return callback["outputs"][0]
+
+
+"""
+==========================================================================
+HTTP client on asyncio streams
+"""
+
+
+async def post(host, port, path, body):
+    """returns the status and response body of a POST request"""
+
+    data = json.dumps(body).encode()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(
+            (
+                f"POST {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                "Content-Type: application/json\r\nConnection: close\r\n"
+                f"Content-Length: {len(data)}\r\n\r\n"
+            ).encode()
+            + data
+        )
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split()[1])
+        headers = dict(
+            line.lower().split(": ", 1) for line in lines[1:] if ": " in line
+        )
+        if "content-length" in headers:
+            content = await reader.readexactly(int(headers["content-length"]))
+        else:
+            content = await reader.read()
+        return status, content
+    finally:
+        writer.close()
+
+
+"""
+==========================================================================
+Interactions
+"""
+
+
+def slider_drag(state):
+    """drag the stock slider to a new position in 5% steps"""
+
+    stocks, cash = state["stock_bond.value"], state["cash.value"]
+    target = random.randrange(0, 101 - cash - state["corp_bonds.value"], 5)
+    step = 5 if target > stocks else -5
+    return [
+        {"stock_bond.value": value}
+        for value in range(stocks + step, target + step, step)
+    ]
+
+
+def cash_drag(state):
+    """drag the cash slider, the browser also clamps the corporate bond and
+    stock sliders
+    """
+
+    stocks, cash = state["stock_bond.value"], state["cash.value"]
+    corp_bonds = state["corp_bonds.value"]
+    target = random.randrange(0, 101, 5)
+    step = 5 if target > cash else -5
+    steps = []
+    for value in range(cash + step, target + step, step):
+        corp_bonds = min(corp_bonds, 100 - value)
+        stocks = min(stocks, 100 - value - corp_bonds)
+        steps.append(
+            {
+                "cash.value": value,
+                "corp_bonds.value": corp_bonds,
+                "stock_bond.value": stocks,
+            }
+        )
+    return steps
+
+
+def corp_bond_drag(state):
+    """drag the corporate bond slider, the browser also clamps the stock slider"""
+
+    stocks, cash = state["stock_bond.value"], state["cash.value"]
+    corp_bonds = state["corp_bonds.value"]
+    target = random.randrange(0, 101 - cash, 5)
+    step = 5 if target > corp_bonds else -5
+    steps = []
+    for value in range(corp_bonds + step, target + step, step):
+        stocks = min(stocks, 100 - cash - value)
+        steps.append({"corp_bonds.value": value, "stock_bond.value": stocks})
+    return steps
+
+
+def preset_click(state):
+    """select one of the time period radio items"""
+
+    return [{"time_period.value": random.randrange(len(state["time_period.options"]))}]
+
+
+def rebalance_change(state):
+    """choose another rebalancing policy"""
+
+    options = [option["value"] for option in state["rebalance.options"]]
+    return [{"rebalance.value": random.choice(options)}]
+
+
+def pin_click(state):
+    """pin the current allocation to compare, or sometimes clear the pinned"""
+
+    button = "clear_pinned" if random.random() < 0.25 else "pin_portfolio"
+    clicks = state.get(f"{button}.n_clicks") or 0
+    return [{f"{button}.n_clicks": clicks + 1}]
+
+
+def typing(prop_id, text, low=None, high=None):
+    """type a number one key at a time, the input sends None while the value
+    is out of range
+    """
+
+    steps = []
+    for i in range(1, len(text) + 1):
+        value = int(text[:i])
+        if (low is not None and value < low) or (high is not None and value > high):
+            value = None
+        steps.append({prop_id: value})
+    return steps
+
+
+def type_start_year(state):
+    year = random.randint(state["start_yr.min"], state["start_yr.max"])
+    return typing(
+        "start_yr.value", str(year), state["start_yr.min"], state["start_yr.max"]
+    )
+
+
+def type_planning_time(state):
+    return typing("planning_time.value", str(random.randint(1, 40)), low=1)
+
+
+def type_start_amount(state):
+    amount = random.choice([1000, 5000, 10000, 25000, 100000])
+    return typing("starting_amount.value", str(amount), low=10)
+
+
+def type_contribution(state):
+    amount = random.choice([0, 500, 1000, 5000])
+    return typing("contribution.value", str(amount), low=0)
+
+
+def type_withdrawal(state):
+    return typing("withdrawal.value", str(random.randint(0, 8)), low=0, high=100)
+
+
+INTERACTIONS = [
+    (slider_drag, 4),
+    (cash_drag, 2),
+    (corp_bond_drag, 1),
+    (preset_click, 3),
+    (rebalance_change, 1),
+    (pin_click, 1),
+    (type_start_year, 2),
+    (type_planning_time, 2),
+    (type_start_amount, 1),
+    (type_contribution, 1),
+    (type_withdrawal, 1),
+]
+
+
+"""
+==========================================================================
+Virtual users
+"""
+
+
+async def run_callbacks(host, port, graph, state, changed, stats, source=None):
+    """fires the callbacks triggered by the changed props concurrently, then the
+    callbacks triggered by their outputs
+    """
+
+    callbacks = graph.triggered(changed, source)
+    results = await asyncio.gather(
+        *[call(host, port, callback, state, changed, stats) for callback in callbacks]
+    )
+    for callback, response in zip(callbacks, results):
+        if not response:
+            continue
+        new = {}
+        for id, props in response.items():
+            for prop, value in props.items():
+                prop_id = f"{id}.{prop}"
+                if state.get(prop_id) != value:
+                    new[prop_id] = value
+        state.update(new)
+        if new:
+            await run_callbacks(host, port, graph, state, new, stats, source=callback)
+
+
+async def call(host, port, callback, state, changed, stats):
+    name = callback_name(callback)
+    tic = time.perf_counter()
+    try:
+        status, content = await post(
+            host, port, ENDPOINT, request_body(callback, state, changed)
+        )
+    except (OSError, asyncio.IncompleteReadError):
+        status, content = None, b""
+    elapsed = time.perf_counter() - tic
+
+    record = stats.setdefault(name, {"latency": [], "errors": 0, "bytes": 0})
+    record["latency"].append(elapsed)
+    record["bytes"] += len(content)
+    if status == 204:
+        return None
+    if status != 200:
+        record["errors"] += 1
+        return None
+    return json.loads(content).get("response")
+
+
+async def virtual_user(host, port, graph, initial_state, deadline, think_time, stats):
+    state = dict(initial_state)
+    await run_callbacks(host, port, graph, state, list(state), stats)
+    interactions, weights = zip(*INTERACTIONS)
+    while time.monotonic() < deadline:
+        interaction = random.choices(interactions, weights)[0]
+        for changes in interaction(state):
+            if time.monotonic() >= deadline:
+                return
+            state.update(changes)
+            await run_callbacks(host, port, graph, state, list(changes), stats)
+            if think_time:
+                await asyncio.sleep(random.expovariate(1 / think_time))
+
+
+async def load_test(url, users, duration, think_time):
+    parts = urlsplit(url)
+    with urllib.request.urlopen(url + "_dash-layout") as response:
+        initial_state = collect_props(json.load(response))
+    with urllib.request.urlopen(url + "_dash-dependencies") as response:
+        graph = CallbackGraph(json.load(response))
+
+    stats = {}
+    deadline = time.monotonic() + duration
+    tic = time.perf_counter()
+    await asyncio.gather(
+        *[
+            virtual_user(
+                parts.hostname,
+                parts.port,
+                graph,
+                initial_state,
+                deadline,
+                think_time,
+                stats,
+            )
+            for _ in range(users)
+        ]
+    )
+    return stats, time.perf_counter() - tic
+
+
+def percentile(values, q):
+    return (
+        statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+        if len(values) > 1
+        else values[0]
+    )
+
+
+def report(stats, elapsed, users):
+    total = sum(len(record["latency"]) for record in stats.values())
+    print(
+        f"\n{users} users, {elapsed:.1f} s, {total} requests, "
+        f"{total / elapsed:.1f} req/s\n"
+    )
+    print(
+        f"{'callback':32} {'requests':>8} {'errors':>6} {'req/s':>7} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'KB/req':>7}"
+    )
+    for name, record in sorted(stats.items()):
+        latency = [t * 1000 for t in record["latency"]]
+        print(
+            f"{name:32} {len(latency):8d} {record['errors']:6d} "
+            f"{len(latency) / elapsed:7.1f} {percentile(latency, 50):8.1f} "
+            f"{percentile(latency, 95):8.1f} {percentile(latency, 99):8.1f} "
+            f"{record['bytes'] / len(latency) / 1024:7.1f}"
+        )
+
+
+"""
+==========================================================================
+Local server
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(port):
+    """starts the app with the threaded development server and waits for it"""
+
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import app; "
+            f"app.app.server.run(host='127.0.0.1', port={port}, threaded=True)",
+        ],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/"
+    for _ in range(300):
+        try:
+            urllib.request.urlopen(url + "_dash-layout").close()
+            return server, url
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("the app exited while starting")
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("the app did not start")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10, help="concurrent users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument(
+        "--think-time", type=float, default=0, help="mean seconds between steps"
+    )
+    parser.add_argument("--url", help="running app, for example http://127.0.0.1:8050/")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_app(free_port())
+    elif not url.endswith("/"):
+        url += "/"
+    try:
+        stats, elapsed = asyncio.run(
+            load_test(url, args.users, args.duration, args.think_time)
+        )
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    report(stats, elapsed, args.users)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+"""
+==========================================================================
+Bounded least recently used caches for callback results
+
+LRUCache keeps the results in the memory of one process.  SharedCache keeps
+them in an SQLite file, so every worker process shares one cache and it
+survives workers being restarted.
+"""
+
+
+class LRUCache:
+    """keeps at most max_entries items using at most max_bytes in total,
+    evicting the least recently used items first
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """returns the cached value or None"""
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, nbytes):
+        """adds value, which is expected to use about nbytes of memory"""
+
+        if nbytes > self.max_bytes or self.max_entries < 1:
+            return
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+            self._items[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while len(self._items) > self.max_entries or self.nbytes > self.max_bytes:
+                self.nbytes -= self._items.popitem(last=False)[1][1]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """counters for monitoring"""
+
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "bytes": self.nbytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+
+class SharedCache:
+    """LRUCache with the items pickled in an SQLite database at path, shared
+    by every process that opens it.  The hit, miss and eviction counters are
+    for this process.
+    """
+
+    def __init__(self, path, max_entries=256, max_bytes=64 * 2**20):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                "key TEXT PRIMARY KEY, value BLOB, nbytes INTEGER, used REAL)"
+            )
+
+    def _connection(self):
+        """one connection per thread, and a new one after a fork"""
+
+        if getattr(self._local, "pid", None) != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return self._local.db
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def get(self, key):
+        """returns the cached value or None"""
+
+        db = self._connection()
+        row = db.execute(
+            "UPDATE items SET used = ? WHERE key = ? RETURNING value",
+            (time.time(), repr(key)),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, value, nbytes):
+        """adds value, which is expected to use about nbytes of memory"""
+
+        if nbytes > self.max_bytes or self.max_entries < 1:
+            return
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)",
+                (repr(key), value, nbytes, time.time()),
+            )
+            evicted = db.execute(
+                "DELETE FROM items WHERE key IN ("
+                " SELECT key FROM ("
+                "  SELECT key, ROW_NUMBER() OVER recent AS n,"
+                "   SUM(nbytes) OVER recent AS total FROM items"
+                "  WINDOW recent AS (ORDER BY used DESC))"
+                " WHERE n > ? OR total > ?)",
+                (self.max_entries, self.max_bytes),
+            ).rowcount
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self.evictions += evicted
+
+    def clear(self):
+        self._connection().execute("DELETE FROM items")
+
+    def stats(self):
+        """counters for monitoring"""
+
+        entries, nbytes = (
+            self._connection()
+            .execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM items")
+            .fetchone()
+        )
+        requests = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": nbytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+"""
+==========================================================================
+Vectorized NumPy engine for portfolio returns
+
+Returns are passed as 2-D arrays with one row per year and one column per
+asset, weights as 2-D arrays with one row per portfolio.  Any number of
+assets is one matrix product, so adding assets adds no Python loops.
+Growth paths are the value of $1 invested at the start of the first year,
+with a leading row of ones for the starting balance (year[0] in the
+backtest dataframe).
+"""
+
+# column order used for the returns matrix passed to the engine
+CASH, BONDS, STOCKS, INFLATION = "3-mon T.Bill", "10yr T.Bond", "S&P 500", "Inflation"
+CORP_BONDS = " Baa Corp Bond"
+ASSETS = [CASH, BONDS, STOCKS, CORP_BONDS]
+
+
+def rebalanced_growth(returns, weights):
+    """growth of $1 for each portfolio in weights, rebalanced annually.
+    returns an array with shape (years + 1, portfolios)
+    """
+
+    growth = np.ones((returns.shape[0] + 1, weights.shape[0]))
+    np.cumprod(1 + returns @ weights.T, axis=0, out=growth[1:])
+    return growth
+
+
+def allocation_weights(stocks, cash, corp_bonds=0):
+    """converts slider percentages to a weight vector in ASSETS order, with
+    the rest in treasury bonds
+    """
+
+    return np.array([cash, 100 - stocks - cash - corp_bonds, stocks, corp_bonds]) / 100
+
+
+def backtest_arrays(
+    returns, weights, start_bal=1, policy="annual", every=1, band=0.05, flows=None
+):
+    """calculates My Portfolio holdings and the single asset balances.
+
+    returns has one column per asset in weights followed by any other
+    columns, like inflation; weights is the allocation.  The portfolio and
+    every single column path are computed in one cumulative product, or for
+    cash flows and the other rebalancing policies by rebalance_paths().
+    Returns a tuple of holdings (years + 1, assets), balances
+    (years + 1, 1 + columns) where the balance columns are the portfolio
+    followed by the returns columns, and whether the portfolio was rebalanced
+    at the start of each year.
+
+    The portfolio total is summed from the holdings, also to round to the same
+    dollar amounts as backtest_loop().
+    """
+
+    n_assets = returns.shape[1]
+    all_weights = np.vstack(
+        [np.append(weights, np.zeros(n_assets - weights.size)), np.eye(n_assets)]
+    )
+    # (1 + growth - 1) repeats the float operations of backtest_loop() so that
+    # half dollar amounts round the same way
+    growth = start_bal * (1 + rebalanced_growth(returns, all_weights) - 1)
+
+    if policy == "annual" and flows is None:
+        # Rebalance at the beginning of each period by reallocating last
+        # period's total, then apply this period's returns
+        holdings = np.empty((growth.shape[0], weights.size))
+        holdings[0] = start_bal * weights
+        holdings[1:] = growth[:-1, :1] * weights * (1 + returns[:, : weights.size])
+        rebalanced = np.full(growth.shape[0], True)
+    else:
+        paths, rebalanced = rebalance_paths(
+            returns[:, : weights.size],
+            weights[None],
+            start_bal,
+            policy,
+            every,
+            band,
+            None if flows is None else flows[:, None],
+        )
+        holdings, rebalanced = paths[:, 0], rebalanced[:, 0]
+    growth[1:, 0] = holdings[1:].sum(axis=1)
+    return holdings, growth, rebalanced
+
+
+def rebalance_paths(
+    returns, weights, start_bal=1, policy="annual", every=1, band=0.05, flows=None
+):
+    """holdings of every portfolio in weights when rebalanced by the policy:
+
+        "annual"  at the start of every year
+        "every"   at the start of every `every` years
+        "band"    at the start of a year when the weight of any asset is more
+                  than band (a fraction, 0.05 for 5%) away from its target
+        "never"   buy and hold
+
+    returns is (years, assets) when every portfolio has the same years or
+    (years, portfolios, assets) when each has its own window, like
+    window_returns().  Whether to rebalance depends on the path so far, so
+    the years are stepped through one at a time, with every portfolio
+    updated at once in each step.
+
+    flows (years, portfolios), like cash_flows(), is added to each portfolio
+    at the start of each year, before rebalancing.  Years that are not
+    rebalanced add or withdraw in proportion to the holdings.  A portfolio
+    that can't pay a withdrawal is depleted and holds nothing from then on,
+    unless later flows add to it again.
+
+    Returns holdings (years + 1, portfolios, assets) where row 0 is the
+    starting balance, and whether each portfolio was rebalanced at the start
+    of each year (years + 1, portfolios).  The first year starts at the
+    target weights, so it always counts as rebalanced.
+    """
+
+    if policy not in ("annual", "every", "band", "never"):
+        raise ValueError(f"unknown rebalancing policy {policy!r}")
+    if returns.ndim == 2:
+        returns = returns[:, None, :]
+    n_years = returns.shape[0]
+    holdings = np.empty((n_years + 1, weights.shape[0], weights.shape[1]))
+    rebalanced = np.zeros(holdings.shape[:2], dtype=bool)
+    holdings[0] = start_bal * weights
+    rebalanced[:2] = True
+
+    growth = 1 + returns
+    last_total = np.full((weights.shape[0], 1), float(start_bal))
+    for t in range(1, n_years + 1):
+        last = holdings[t - 1]
+        if t == 1:
+            pass
+        elif policy == "annual":
+            rebalanced[t] = True
+        elif policy == "every":
+            rebalanced[t] = (t - 1) % every == 0
+        elif policy == "band":
+            with np.errstate(invalid="ignore"):
+                drift = np.abs(last / last_total - weights)
+            rebalanced[t] = (drift > band).any(axis=1)
+
+        if flows is None:
+            total = last_total
+            drifted = last
+        else:
+            # an empty portfolio starts again at the target weights
+            rebalanced[t] |= last_total[:, 0] <= 0
+            total = np.maximum(last_total + flows[t - 1][:, None], 0)
+            scale = np.divide(
+                total, last_total, out=np.zeros_like(total), where=last_total > 0
+            )
+            drifted = last * scale
+        start = np.where(rebalanced[t][:, None], total * weights, drifted)
+        holdings[t] = start * growth[t - 1]
+        last_total = holdings[t].sum(axis=1)[:, None]
+    return holdings, rebalanced
+
+
+def portfolio_balances(
+    returns, weights, start_bal=1, policy="annual", every=1, band=0.05, flows=None
+):
+    """balances of every portfolio in weights over the same returns, rebalanced
+    by the policy, in an array (years + 1, portfolios).  flows is
+    (years, portfolios) like for rebalance_paths(), so portfolios with and
+    without cash flows can be evaluated together.
+    """
+
+    if policy == "annual" and flows is None:
+        return start_bal * rebalanced_growth(returns, weights)
+    holdings, _ = rebalance_paths(
+        returns, weights, start_bal, policy, every, band, flows
+    )
+    return holdings.sum(axis=2)
+
+
+def cash_flows(inflation, contribution=0, withdrawal=0):
+    """amounts added at the start of each year: the contribution, less the
+    withdrawal raised by the inflation of the years before.  inflation is
+    (years,) or (years, windows) like window_returns().
+    """
+
+    index = np.ones_like(inflation, dtype=float)
+    np.cumprod(1 + inflation[:-1], axis=0, out=index[1:])
+    return contribution - withdrawal * index
+
+
+def safe_withdrawal_rates(
+    returns, inflation, weights, nper, policy="annual", every=1, band=0.05, tol=1e-5
+):
+    """highest withdrawal rate, as a fraction of the starting balance raised
+    with inflation every year, that never depleted the portfolio in each
+    window of nper years of returns, with one rate per window.
+
+    Every window is bisected at once: each step simulates all the windows
+    with their own trial rates and halves each window's interval.
+    """
+
+    windows = window_returns(returns, nper)
+    # flows of withdrawing all of the starting balance, scaled by each rate
+    full_withdrawal = cash_flows(
+        window_returns(inflation[:, None], nper)[:, :, 0], withdrawal=1
+    )
+    weights = np.broadcast_to(weights, (windows.shape[1], weights.size))
+
+    low = np.zeros(windows.shape[1])
+    high = np.ones(windows.shape[1])
+    while (high - low).max() > tol:
+        rate = (low + high) / 2
+        holdings, _ = rebalance_paths(
+            windows, weights, 1, policy, every, band, flows=rate * full_withdrawal
+        )
+        lasted = holdings[-1].sum(axis=1) > 0
+        low = np.where(lasted, rate, low)
+        high = np.where(lasted, high, rate)
+    return low
+
+
+def window_returns(returns, nper):
+    """returns of every window of nper consecutive rows, with shape
+    (nper, windows, columns) for rebalance_paths()
+    """
+
+    starts = np.arange(returns.shape[0] - nper + 1)
+    return returns[starts + np.arange(nper)[:, None]]
+
+
+def rolling_growth(growth, nper):
+    """growth of $1 over every nper year period in the growth paths"""
+
+    return growth[nper:] / growth[:-nper]
+
+
+def period_cagrs(growth):
+    """CAGR of every period in a growth path of one portfolio, from the ratios
+    of the growth at its end and start.  returns an array (start rows x years)
+    where [i, n - 1] is the n year period starting at row i, and nan for
+    periods that would end after the last row
+    """
+
+    rows = growth.shape[0] - 1
+    years = np.arange(1, rows + 1)
+    ends = np.arange(rows)[:, None] + years
+    ratios = growth[np.minimum(ends, rows)] / growth[:rows, None]
+    return np.where(ends <= rows, ratios ** (1 / years) - 1, np.nan)
+
+
+def allocation_stats(returns, weights):
+    """CAGR, volatility and worst 1 year return of every portfolio in weights,
+    rebalanced annually, in arrays with one value per portfolio.  Also returns
+    the row of the worst year.
+    """
+
+    portfolio_returns = returns @ weights.T
+    growth = np.prod(1 + portfolio_returns, axis=0)
+    worst_row = portfolio_returns.argmin(axis=0)
+    return {
+        "cagr": growth ** (1 / len(returns)) - 1,
+        "volatility": portfolio_returns.std(axis=0, ddof=1 if len(returns) > 1 else 0),
+        "worst": portfolio_returns[worst_row, np.arange(weights.shape[0])],
+        "worst_row": worst_row,
+    }
+
+
+def window_stats(returns, weights, first, nper):
+    """growth of $1, CAGR and worst 1 year return of every portfolio in
+    weights over its own window of nper rows of returns starting at row first,
+    rebalanced annually.  first and nper have one value per portfolio.  Also
+    returns the row of the worst year.
+    """
+
+    cols = np.arange(weights.shape[0])
+    portfolio_returns = returns @ weights.T
+    growth = np.ones((returns.shape[0] + 1, weights.shape[0]))
+    np.cumprod(1 + portfolio_returns, axis=0, out=growth[1:])
+    ending = growth[first + nper, cols] / growth[first, cols]
+
+    rows = np.arange(returns.shape[0])[:, None]
+    in_window = (rows >= first) & (rows < first + nper)
+    worst_row = np.where(in_window, portfolio_returns, np.inf).argmin(axis=0)
+    return {
+        "growth": ending,
+        "cagr": ending ** (1 / nper) - 1,
+        "worst": portfolio_returns[worst_row, cols],
+        "worst_row": worst_row,
+    }
+
+
+def risk_metrics(returns, weights, risk_free):
+    """annual volatility, maximum drawdown and Sharpe and Sortino ratios of
+    every portfolio in weights, rebalanced annually, in arrays with one value
+    per portfolio.  risk_free has the risk free return of each year.
+    """
+
+    return series_risk_metrics(returns @ weights.T, risk_free)
+
+
+def series_risk_metrics(portfolio_returns, risk_free):
+    """risk_metrics() of portfolios given by their annual returns, with one
+    column per portfolio.
+
+    The drawdown peak, trough and recovery are rows of the growth path, where
+    row 0 is the starting balance.  The recovery row is the first one back at
+    the peak after the trough, or -1 if the path doesn't get back to it.
+    """
+
+    cols = np.arange(portfolio_returns.shape[1])
+    growth = np.ones((portfolio_returns.shape[0] + 1, portfolio_returns.shape[1]))
+    np.cumprod(1 + portfolio_returns, axis=0, out=growth[1:])
+
+    peaks = np.maximum.accumulate(growth, axis=0)
+    drawdowns = growth / peaks - 1
+    trough_row = drawdowns.argmin(axis=0)
+    rows = np.arange(growth.shape[0])[:, None]
+    peak_row = np.where((growth == peaks) & (rows <= trough_row), rows, 0).max(axis=0)
+    recovered = (rows > trough_row) & (growth >= growth[peak_row, cols])
+    recovery_row = np.where(recovered.any(axis=0), recovered.argmax(axis=0), -1)
+
+    excess = portfolio_returns - risk_free[:, None]
+    ddof = 1 if len(portfolio_returns) > 1 else 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = excess.mean(axis=0) / excess.std(axis=0, ddof=ddof)
+        sortino = excess.mean(axis=0) / np.sqrt(
+            (np.minimum(excess, 0) ** 2).mean(axis=0)
+        )
+    return {
+        "volatility": portfolio_returns.std(axis=0, ddof=ddof),
+        "max_drawdown": drawdowns[trough_row, cols],
+        "peak_row": peak_row,
+        "trough_row": trough_row,
+        "recovery_row": recovery_row,
+        "sharpe": sharpe,
+        "sortino": sortino,
+    }
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import time
+import numpy as np
+import engine
+
+"""
+==========================================================================
+Precomputed results for every slider allocation and time period
+
+The sliders move in 5% steps, so there are 231 (cash, stocks) allocations
+without corporate bonds, the rest in treasury bonds.  Allocations with
+corporate bonds are calculated when needed.
+For each one the ending balance per $1 and the CAGR are stored for every
+(start year, number of years) window.  Only windows that end inside the data
+are valid, so the windows are packed into one row per allocation:
+window = offsets[start] + years - 1.
+
+ResultGrid.shared() saves the arrays to .npy files the first time and
+memory-maps them after that, so every worker process reads one copy from
+the page cache.
+"""
+
+ALLOCATIONS = [
+    (cash, stocks) for cash in range(0, 101, 5) for stocks in range(0, 101 - cash, 5)
+]
+ALLOCATION_INDEX = {allocation: i for i, allocation in enumerate(ALLOCATIONS)}
+WEIGHTS = np.array(
+    [engine.allocation_weights(stocks, cash) for cash, stocks in ALLOCATIONS]
+)
+
+# every (cash, corp bonds, stocks) position of the three sliders
+SLIDER_ALLOCATIONS = [
+    (cash, corp_bonds, stocks)
+    for cash in range(0, 101, 5)
+    for corp_bonds in range(0, 101 - cash, 5)
+    for stocks in range(0, 101 - cash - corp_bonds, 5)
+]
+SLIDER_WEIGHTS = np.array(
+    [
+        engine.allocation_weights(stocks, cash, corp_bonds)
+        for cash, corp_bonds, stocks in SLIDER_ALLOCATIONS
+    ]
+)
+
+
+class ResultGrid:
+    """ending balance per $1 and CAGR for every allocation and time period"""
+
+    def __init__(self, returns, min_yr):
+        """returns has columns [cash, bonds, stocks] for each year from min_yr"""
+
+        tic = time.perf_counter()
+        n_years = returns.shape[0]
+        self.min_yr = min_yr
+
+        # one cumulative growth path per allocation for the full data range
+        growth = engine.rebalanced_growth(returns, WEIGHTS).T
+
+        # every (start, years) window that ends within the data
+        periods = np.arange(n_years, 0, -1)
+        self.offsets = np.concatenate([[0], np.cumsum(periods)[:-1]])
+        start = np.repeat(np.arange(n_years), periods)
+        nper = np.arange(start.size) - np.repeat(self.offsets, periods) + 1
+
+        # ending balances are kept in float64 so that multi-million dollar
+        # amounts still round to the same dollar as backtest()
+        self.ending = growth[:, start + nper] / growth[:, start]
+        self.cagr = (self.ending ** (1 / nper) - 1).astype(np.float32)
+
+        self.build_time = time.perf_counter() - tic
+
+    @classmethod
+    def shared(cls, returns, min_yr, directory):
+        """the grid for returns memory-mapped read only from files in
+        directory, built and saved by the first process that needs them
+        """
+
+        tic = time.perf_counter()
+        digest = hashlib.sha1(returns.tobytes() + str(min_yr).encode()).hexdigest()
+        prefix = os.path.join(directory, f"grid-{digest[:16]}")
+        paths = {name: f"{prefix}-{name}.npy" for name in ("ending", "cagr", "offsets")}
+
+        if not all(os.path.exists(path) for path in paths.values()):
+            os.makedirs(directory, exist_ok=True)
+            result_grid = cls(returns, min_yr)
+            for name, path in paths.items():
+                # write to a temporary file first so other processes never
+                # load a partial array
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    np.save(f, getattr(result_grid, name))
+                os.replace(tmp, path)
+
+        result_grid = cls.__new__(cls)
+        result_grid.min_yr = min_yr
+        for name, path in paths.items():
+            setattr(result_grid, name, np.load(path, mmap_mode="r"))
+        result_grid.build_time = time.perf_counter() - tic
+        return result_grid
+
+    @property
+    def nbytes(self):
+        return self.ending.nbytes + self.cagr.nbytes + self.offsets.nbytes
+
+    def lookup(self, stocks, cash, start_yr, planning_time):
+        """returns ending balance per $1 and cagr for the allocation and period"""
+
+        allocation = ALLOCATION_INDEX[(cash, stocks)]
+        window = self.offsets[start_yr - self.min_yr] + planning_time - 1
+        return self.ending[allocation, window], self.cagr[allocation, window]
+
+    def report(self):
+        windows = self.ending.shape[1]
+        return (
+            f"{len(ALLOCATIONS)} allocations x {windows} periods: "
+            f"built in {self.build_time * 1000:.1f} ms, "
+            f"{self.nbytes / 2**20:.1f} MiB"
+        )
+
+
+def best_allocations(returns, max_loss=None, max_drawdown=None, n=5):
+    """the n slider allocations with the highest CAGR over the returns,
+    rebalanced annually, whose worst 1 year return and maximum drawdown lose
+    no more than max_loss and max_drawdown (fractions, None for no limit),
+    best first.
+
+    returns has the annual returns of the period in engine.ASSETS columns.
+    The CAGRs and worst years of all SLIDER_ALLOCATIONS are one matrix
+    product, and the drawdowns, which need the growth paths, are only
+    calculated for the allocations within max_loss.  Returns a dict of arrays
+    with the SLIDER_ALLOCATIONS indices and their cagr, worst 1 year return,
+    its row in returns and max drawdown.
+    """
+
+    stats = engine.allocation_stats(returns, SLIDER_WEIGHTS)
+    candidates = np.argsort(-stats["cagr"], kind="stable")
+    if max_loss is not None:
+        candidates = candidates[stats["worst"][candidates] >= -max_loss]
+
+    drawdown = engine.series_risk_metrics(
+        returns @ SLIDER_WEIGHTS[candidates].T, np.zeros(len(returns))
+    )["max_drawdown"]
+    feasible = np.full(candidates.size, True)
+    if max_drawdown is not None:
+        feasible = drawdown >= -max_drawdown
+    best = np.flatnonzero(feasible)[:n]
+    allocation = candidates[best]
+    return {
+        "allocation": allocation,
+        "cagr": stats["cagr"][allocation],
+        "worst": stats["worst"][allocation],
+        "worst_row": stats["worst_row"][allocation],
+        "max_drawdown": drawdown[best],
+    }
+
+
+if __name__ == "__main__":
+    from app import result_grid
+
+    print(result_grid.report())
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import pickle
+import shutil
+import signal
+import sqlite3
+import threading
+import time
+
+try:
+    from dash.background_callback.managers import BaseBackgroundCallbackManager
+    from dash.background_callback.managers.diskcache_manager import _make_job_fn
+except ImportError:  # dash < 3
+    from dash.long_callback.managers import (
+        BaseLongCallbackManager as BaseBackgroundCallbackManager,
+    )
+    from dash.long_callback.managers.diskcache_manager import _make_job_fn
+
+"""
+==========================================================================
+Background callbacks on the local disk
+
+A Dash background callback manager that needs no broker or extra packages.
+Each job runs in a forked child process, and its progress, result and
+set_props updates are written to an SQLite file that every worker process
+of the server can read, so a job started by one worker can be polled by
+another.
+
+Identical jobs, the same callback with the same inputs, share one process
+while it runs: the job is only cancelled when every client waiting for it
+has cancelled or moved on to other inputs.  Finished results are kept for
+`expire` seconds, so clients that asked for the same job get the result
+without running it again.
+"""
+
+# job id for results that were already finished
+FINISHED = 0
+
+# whether /proc shows processes that finished but were not reaped yet
+PROC = os.path.isdir("/proc/self")
+
+
+class JobManager(BaseBackgroundCallbackManager):
+    """runs background callbacks in child processes with the jobs and their
+    results in an SQLite database at path
+    """
+
+    def __init__(self, path, expire=60, cache_by=None):
+        self.path = path
+        self.expire = expire
+        self._local = threading.local()
+        self._fork = multiprocessing.get_context("fork")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._connection()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value BLOB, expires REAL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "key TEXT PRIMARY KEY, pid INTEGER, waiters INTEGER)"
+        )
+        super().__init__(cache_by)
+
+    def _connection(self):
+        """one connection per thread, and a new one after a fork"""
+
+        if getattr(self._local, "pid", None) != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return self._local.db
+
+    def _transaction(self, work):
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(db)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return result
+
+    """
+    ----------------------------------------------------------------------
+    results, progress and set_props updates of the jobs
+    """
+
+    def set(self, key, value):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+            (
+                key,
+                pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL),
+                time.time() + self.expire,
+            ),
+        )
+
+    def get(self, key, default=None):
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value FROM results WHERE key = ? AND expires > ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return default if row is None else pickle.loads(row[0])
+
+    def clear_cache_entry(self, key):
+        self._connection().execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def get_progress(self, key):
+        # left for the other clients waiting for the same job
+        return self.get(self._make_progress_key(key))
+
+    def result_ready(self, key):
+        return self.get(key, self.UNDEFINED) is not self.UNDEFINED
+
+    def get_result(self, key, job):
+        # Dash releases the job with terminate_job() once it has the result
+        return self.get(key, self.UNDEFINED)
+
+    def get_updated_props(self, key):
+        props = self.get(self._make_set_props_key(key), self.UNDEFINED)
+        if props is self.UNDEFINED:
+            return {}
+        self.clear_cache_entry(self._make_set_props_key(key))
+        return props
+
+    def get_or_create_signing_secret(self, generate):
+        self._connection().execute(
+            "INSERT OR IGNORE INTO results VALUES (?, ?, ?)",
+            (
+                self.SIGNING_SECRET_KEY,
+                pickle.dumps(generate()),
+                float("inf"),
+            ),
+        )
+        return self.get(self.SIGNING_SECRET_KEY)
+
+    """
+    ----------------------------------------------------------------------
+    jobs
+    """
+
+    def make_job_fn(self, fn, progress, key=None):
+        # Dash's job function only needs set() from its cache
+        return _make_job_fn(fn, self, progress)
+
+    def call_job_fn(self, key, job_fn, args, context):
+        """returns the pid of the process running the job for key, starting
+        one unless an identical job is running or has finished
+        """
+
+        multiprocessing.active_children()  # reap finished jobs of this process
+
+        def join(db):
+            """the job id if the job finished or runs, with one more waiter"""
+            if self.result_ready(key):
+                return FINISHED
+            row = db.execute("SELECT pid FROM jobs WHERE key = ?", (key,)).fetchone()
+            if row is not None and alive(row[0]):
+                db.execute(
+                    "UPDATE jobs SET waiters = waiters + 1 WHERE key = ?", (key,)
+                )
+                return row[0]
+            return None
+
+        job = self._transaction(join)
+        if job is not None:
+            return job
+
+        # forked outside of any transaction, SQLite locks don't survive a fork
+        process = self._fork.Process(
+            target=job_fn,
+            args=(key, self._make_progress_key(key), args, context),
+            daemon=True,
+        )
+        process.start()
+
+        def add(db):
+            job = join(db)
+            if job is None:
+                db.execute(
+                    "INSERT OR REPLACE INTO jobs VALUES (?, ?, 1)", (key, process.pid)
+                )
+            self._forget_stale_jobs(db)
+            return job
+
+        job = self._transaction(add)
+        if job is None:
+            return process.pid
+        # another worker started the same job meanwhile
+        process.kill()
+        return job
+
+    def _forget_stale_jobs(self, db):
+        """deletes expired results and the jobs that died without a result"""
+
+        db.execute("DELETE FROM results WHERE expires <= ?", (time.time(),))
+        for key, pid in db.execute("SELECT key, pid FROM jobs").fetchall():
+            if not alive(pid) and not self.result_ready(key):
+                db.execute("DELETE FROM jobs WHERE key = ?", (key,))
+
+    def terminate_job(self, job):
+        """a client stops waiting for the job, which is killed when no other
+        client waits for it
+        """
+
+        if not job or int(job) == FINISHED:
+            return
+        pid = int(job)
+
+        def release(db):
+            row = db.execute(
+                "UPDATE jobs SET waiters = waiters - 1 WHERE pid = ? RETURNING waiters",
+                (pid,),
+            ).fetchone()
+            if row is not None and row[0] <= 0:
+                db.execute("DELETE FROM jobs WHERE pid = ?", (pid,))
+                return True
+            return False
+
+        if self._transaction(release) and alive(pid):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        multiprocessing.active_children()
+
+    def terminate_unhealthy_job(self, job):
+        if job and not self.job_running(job):
+            self._connection().execute("DELETE FROM jobs WHERE pid = ?", (int(job),))
+            return True
+        return False
+
+    def job_running(self, job):
+        """whether the job runs or has just finished, so Dash keeps polling
+        until it has the result
+        """
+
+        if not job or int(job) == FINISHED:
+            return False
+        multiprocessing.active_children()
+        row = (
+            self._connection()
+            .execute("SELECT key FROM jobs WHERE pid = ?", (int(job),))
+            .fetchone()
+        )
+        return row is not None and (alive(int(job)) or self.result_ready(row[0]))
+
+    def stats(self):
+        """running jobs and stored results for monitoring"""
+
+        db = self._connection()
+        jobs, waiters = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(waiters), 0) FROM jobs"
+        ).fetchone()
+        results = db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {"jobs": jobs, "waiters": waiters, "results": results}
+
+
+def alive(pid):
+    """whether the process runs, and hasn't finished waiting to be reaped"""
+
+    if PROC:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+        except OSError:
+            return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def remove_directory(path, pid):
+    """removes the job store directory at exit of the process that made it,
+    not of the workers forked from it"""
+
+    if os.getpid() == pid:
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+import functools
+import os
+import threading
+import time
+import flask
+
+"""
+==========================================================================
+Per-callback timing and payload metrics in the Prometheus text format
+
+Every request to the Dash callback endpoint is timed from the moment Flask
+receives it until the response is ready, so the time includes running the
+callback and serializing its outputs.  Stages inside callbacks are timed
+with the timed() decorator.  The counters are kept per process, so each
+worker of a multi-process server reports its own.
+
+Set METRICS=off to turn it off, then timed() returns the functions
+unchanged and no request hooks or routes are added.
+"""
+
+ENABLED = os.environ.get("METRICS", "on") != "off"
+
+# seconds
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+# bytes
+PAYLOAD_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CALLBACK_ENDPOINT = "/_dash-update-component"
+
+
+def label_value(value):
+    """value escaped for a label in the text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """cumulative bucket counts, sum and count of the observed values"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class Registry:
+    """latency, payload size, call and error counts per callback and latency
+    per stage
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.errors = {}
+        self.latency = {}
+        self.payload = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def observe_callback(self, callback, seconds, nbytes, error=False):
+        with self._lock:
+            if callback not in self.calls:
+                self.calls[callback] = 0
+                self.errors[callback] = 0
+                self.latency[callback] = Histogram(LATENCY_BUCKETS)
+                self.payload[callback] = Histogram(PAYLOAD_BUCKETS)
+            self.calls[callback] += 1
+            self.errors[callback] += error
+            self.latency[callback].observe(seconds)
+            self.payload[callback].observe(nbytes)
+
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram(LATENCY_BUCKETS)
+            self.stages[stage].observe(seconds)
+
+    def clear(self):
+        with self._lock:
+            for counters in (
+                self.calls,
+                self.errors,
+                self.latency,
+                self.payload,
+                self.stages,
+            ):
+                counters.clear()
+
+    def render(self):
+        """the metrics in the Prometheus text exposition format"""
+
+        lines = []
+
+        def counter(name, help, values):
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} counter"])
+            for callback, value in sorted(values.items()):
+                lines.append(f'{name}{{callback="{label_value(callback)}"}} {value}')
+
+        def histogram(name, help, label, values):
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} histogram"])
+            for key, hist in sorted(values.items()):
+                lines.extend(hist.lines(name, f'{label}="{label_value(key)}"'))
+
+        with self._lock:
+            counter("dash_callback_calls_total", "Callback requests.", self.calls)
+            counter(
+                "dash_callback_errors_total",
+                "Callback requests that failed.",
+                self.errors,
+            )
+            histogram(
+                "dash_callback_duration_seconds",
+                "Time to run a callback and serialize its outputs.",
+                "callback",
+                self.latency,
+            )
+            histogram(
+                "dash_callback_response_bytes",
+                "Size of the callback responses.",
+                "callback",
+                self.payload,
+            )
+            histogram(
+                "dash_callback_stage_duration_seconds",
+                "Time spent in stages of the callbacks.",
+                "stage",
+                self.stages,
+            )
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def timed(stage):
+    """decorator that records the time of every call as the stage"""
+
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tic = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                registry.observe_stage(stage, time.perf_counter() - tic)
+
+        return wrapper
+
+    return decorator
+
+
+def callback_name(app, output):
+    """name of the function of the callback with the output, like
+    update_totals.  Outputs of no callback are all "unknown", so a client can't
+    add series.
+    """
+
+    callback = None
+    if isinstance(output, str):
+        callback = app.callback_map.get(output, {}).get("callback")
+    return getattr(callback, "__name__", "unknown")
+
+
+def instrument(app, route="/metrics"):
+    """records every callback request of the Dash app and serves the metrics
+    on the route
+    """
+
+    if not ENABLED:
+        return
+    server = app.server
+    endpoint = app.config.requests_pathname_prefix + CALLBACK_ENDPOINT.lstrip("/")
+
+    def record(error, nbytes=0):
+        tic = flask.g.pop("metrics_tic", None)
+        if tic is None:
+            return
+        output = (flask.request.get_json(silent=True) or {}).get("output")
+        registry.observe_callback(
+            callback_name(app, output), time.perf_counter() - tic, nbytes, error
+        )
+
+    @server.before_request
+    def start_timer():
+        if flask.request.path == endpoint:
+            flask.g.metrics_tic = time.perf_counter()
+
+    @server.after_request
+    def record_response(response):
+        record(response.status_code >= 400, response.calculate_content_length() or 0)
+        return response
+
+    # requests that raise skip the after_request hooks in debug mode
+    @server.teardown_request
+    def record_exception(exc):
+        if exc is not None:
+            record(True)
+
+    @server.route(route)
+    def metrics():
+        return flask.Response(registry.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+"""
+==========================================================================
+Monte Carlo simulation by resampling the historic annual returns
+
+Paths are generated in chunks as 2-D arrays (paths x years) of portfolio
+returns sampled from the history, either one year at a time (iid) or in
+blocks of consecutive years to keep multi-year regimes together.  Each chunk
+is reduced to a histogram of log growth per year before the next one is
+generated, so memory is bounded no matter how many paths are simulated.
+Chunks have their own seeds spawned from one seed, so results are the same
+whether they run in this process or fanned across a process pool.
+"""
+
+CHUNK_SIZE = 10_000
+N_BINS = 4000
+
+# histograms cover the mean log growth +/- this many standard deviations
+BIN_SPREAD = 8
+
+# workers in the process pool, 0 to run every chunk in this process
+WORKERS = int(os.environ.get("SIMULATION_WORKERS", 0))
+
+_pools = {}
+
+
+def _get_pool(workers):
+    if workers not in _pools:
+        _pools[workers] = ProcessPoolExecutor(workers)
+    return _pools[workers]
+
+
+def sample_indices(rng, n_paths, n_years, n_data, block=1):
+    """indices of the sampled years for each path, with circular blocks of
+    block consecutive years
+    """
+
+    n_blocks = -(-n_years // block)
+    starts = rng.integers(0, n_data, (n_paths, n_blocks, 1))
+    indices = (starts + np.arange(block)) % n_data
+    return indices.reshape(n_paths, -1)[:, :n_years]
+
+
+def histogram_edges(log_returns, n_years):
+    """lowest edge and bin width of the log growth histogram for each year"""
+
+    years = np.arange(1, n_years + 1)
+    spread = BIN_SPREAD * max(log_returns.std(), 1e-6) * np.sqrt(years)
+    low = log_returns.mean() * years - spread
+    return low, 2 * spread / N_BINS
+
+
+def simulate_chunk(log_returns, n_years, n_paths, block, seed, low, width):
+    """returns the log growth histogram counts (years x bins) for one chunk"""
+
+    rng = np.random.default_rng(seed)
+    indices = sample_indices(rng, n_paths, n_years, len(log_returns), block)
+    log_growth = np.cumsum(log_returns[indices], axis=1)
+
+    bins = ((log_growth - low) / width).astype(np.int64)
+    np.clip(bins, 0, N_BINS - 1, out=bins)
+    bins += np.arange(n_years) * N_BINS
+    return np.bincount(bins.ravel(), minlength=n_years * N_BINS).reshape(
+        n_years, N_BINS
+    )
+
+
+def simulate(
+    returns,
+    n_years,
+    n_paths,
+    percentiles=(5, 25, 50, 75, 95),
+    block=1,
+    seed=0,
+    workers=None,
+    progress=None,
+):
+    """simulates n_paths of n_years by resampling returns, the annual returns
+    of a portfolio rebalanced annually, and returns the percentiles of the
+    growth of $1 in an array (percentiles x years + 1).  progress, if given,
+    is called with the paths done and n_paths after each chunk
+    """
+
+    workers = WORKERS if workers is None else workers
+    log_returns = np.log1p(returns)
+    low, width = histogram_edges(log_returns, n_years)
+
+    sizes = [CHUNK_SIZE] * (n_paths // CHUNK_SIZE)
+    if n_paths % CHUNK_SIZE:
+        sizes.append(n_paths % CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [
+        (log_returns, n_years, size, block, chunk_seed, low, width)
+        for size, chunk_seed in zip(sizes, seeds)
+    ]
+
+    if workers and len(args) > 1:
+        chunks = _get_pool(workers).map(simulate_chunk, *zip(*args))
+    else:
+        chunks = (simulate_chunk(*chunk_args) for chunk_args in args)
+    counts = 0
+    done = 0
+    for size, chunk in zip(sizes, chunks):
+        counts = counts + chunk
+        done += size
+        if progress is not None:
+            progress(done, n_paths)
+
+    # interpolate the percentiles within the histogram bins
+    cumulative = counts.cumsum(axis=1)
+    years = np.arange(n_years)
+    result = np.ones((len(percentiles), n_years + 1))
+    for i, percentile in enumerate(percentiles):
+        target = percentile / 100 * n_paths
+        bins = (cumulative < target).sum(axis=1).clip(0, N_BINS - 1)
+        below = np.where(bins > 0, cumulative[years, bins - 1], 0)
+        fraction = (target - below) / np.maximum(counts[years, bins], 1)
+        result[i, 1:] = np.exp(low + (bins + fraction) * width)
+    return result
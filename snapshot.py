@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+
+"""
+==========================================================================
+Binary snapshot of the historic returns
+
+The first start after the CSV changes parses it with pandas, adds the start
+year row and writes the result as a NumPy structured array named after a
+hash of the CSV.  Later starts load the snapshot memory-mapped instead of
+parsing the CSV.  If the snapshot directory is not writable the CSV is
+parsed every time.
+"""
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CSV = os.path.join(HERE, "assets", "historic.csv")
+SNAPSHOT_DIR = os.environ.get("DATA_SNAPSHOT_DIR", os.path.join(HERE, ".snapshot"))
+
+
+def read_csv(path):
+    """historic returns with a row of zero returns for the year before the
+    first year, since the data is as of year end
+    """
+
+    df = pd.read_csv(path)
+    return (
+        pd.concat([df, pd.DataFrame([{"Year": df.Year.min() - 1}])], ignore_index=True)
+        .sort_values("Year", ignore_index=True)
+        .fillna(0)
+    )
+
+
+def snapshot_path(path):
+    with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(SNAPSHOT_DIR, f"{name}-{digest}.npy")
+
+
+def write_snapshot(df, path):
+    """saves the dataframe as a structured array, written to a temporary file
+    first so other processes never load a partial snapshot
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    records = df.to_records(index=False)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, records)
+    os.replace(tmp, path)
+
+
+def load_historic(path=CSV):
+    """returns the dataframe of read_csv(path), from the snapshot if there is one"""
+
+    snapshot = snapshot_path(path)
+    if os.path.exists(snapshot):
+        return pd.DataFrame(np.load(snapshot, mmap_mode="r"))
+
+    df = read_csv(path)
+    try:
+        write_snapshot(df, snapshot)
+    except OSError:
+        pass
+    return df
@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+import app
+
+"""
+==========================================================================
+backtest() with the numpy engine matches the original loop, one year at a
+time, for random allocations, periods, rebalancing and cash flows
+
+Run with: python -m pytest
+"""
+
+
+def random_cases(n, seed=0):
+    rng = random.Random(seed)
+    min_yr, max_yr = int(app.MIN_YR), int(app.MAX_YR)
+    for rebalance in app.REBALANCING:
+        for _ in range(n):
+            cash = rng.randrange(0, 101, 5)
+            corp_bonds = rng.randrange(0, 101 - cash, 5)
+            stocks = rng.randrange(0, 101 - cash - corp_bonds, 5)
+            start_yr = rng.randint(min_yr, max_yr)
+            nper = rng.randint(1, max_yr - start_yr + 1)
+            yield (
+                stocks,
+                cash,
+                rng.choice([10, 10000, 12345]),
+                nper,
+                start_yr,
+                corp_bonds,
+                rebalance,
+                rng.choice([0, 500, 1234]),
+                rng.choice([0, 3, 4.5, 8, 15]),
+            )
+
+
+@pytest.mark.parametrize("args", list(random_cases(10)))
+def test_numpy_engine_matches_loop(monkeypatch, args):
+    monkeypatch.setattr(app, "BACKTEST_ENGINE", "loop")
+    expected = app.backtest(*args)
+    monkeypatch.setattr(app, "BACKTEST_ENGINE", "numpy")
+    result = app.backtest(*args)
+
+    assert list(result.columns) == list(expected.columns)
+    assert result.equals(expected)
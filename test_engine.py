@@ -0,0 +1,111 @@
+import random
+import statistics
+
+import numpy as np
+import pytest
+
+import app
+import engine
+
+"""
+==========================================================================
+engine.series_risk_metrics() and engine.safe_withdrawal_rates() match
+references that go one year at a time
+
+Run with: python -m pytest
+"""
+
+
+def drawdown_reference(portfolio_returns):
+    """max drawdown and its peak, trough and recovery rows of the growth path"""
+
+    growth = [1.0]
+    for r in portfolio_returns:
+        growth.append(growth[-1] * (1 + r))
+    peak_row = trough_row = best_peak = 0
+    max_drawdown = 0.0
+    for row, balance in enumerate(growth):
+        if balance >= growth[best_peak]:
+            best_peak = row
+        drawdown = balance / growth[best_peak] - 1
+        if drawdown < max_drawdown:
+            max_drawdown, peak_row, trough_row = drawdown, best_peak, row
+    recovery_row = next(
+        (
+            row
+            for row in range(trough_row + 1, len(growth))
+            if growth[row] >= growth[peak_row]
+        ),
+        -1,
+    )
+    return max_drawdown, peak_row, trough_row, recovery_row
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_series_risk_metrics_match_reference(seed):
+    rng = random.Random(seed)
+    years = rng.randint(1, 40)
+    portfolio_returns = np.array(
+        [[rng.gauss(0.06, 0.18) for _ in range(30)] for _ in range(years)]
+    )
+    risk_free = np.array([rng.uniform(0, 0.05) for _ in range(years)])
+    metrics = engine.series_risk_metrics(portfolio_returns, risk_free)
+
+    for i, column in enumerate(portfolio_returns.T):
+        max_drawdown, peak_row, trough_row, recovery_row = drawdown_reference(column)
+        assert metrics["max_drawdown"][i] == pytest.approx(max_drawdown)
+        if max_drawdown < 0:
+            assert metrics["peak_row"][i] == peak_row
+            assert metrics["trough_row"][i] == trough_row
+            assert metrics["recovery_row"][i] == recovery_row
+
+        if years > 1:
+            excess = [r - f for r, f in zip(column, risk_free)]
+            downside = (sum(min(e, 0) ** 2 for e in excess) / years) ** 0.5
+            mean, stdev = statistics.mean(excess), statistics.stdev(excess)
+            assert metrics["sharpe"][i] == pytest.approx(mean / stdev)
+            if downside:
+                assert metrics["sortino"][i] == pytest.approx(mean / downside)
+            else:
+                assert metrics["sortino"][i] == np.inf
+
+
+def random_withdrawal_cases(n, seed=0):
+    rng = random.Random(seed)
+    min_yr, max_yr = int(app.MIN_YR), int(app.MAX_YR)
+    for _ in range(n):
+        cash = rng.randrange(0, 101, 5)
+        corp_bonds = rng.randrange(0, 101 - cash, 5)
+        stocks = rng.randrange(0, 101 - cash - corp_bonds, 5)
+        nper = rng.randint(1, 40)
+        start_yr = rng.randint(min_yr, max_yr - nper + 1)
+        rebalance = rng.choice(list(app.REBALANCING))
+        yield stocks, cash, corp_bonds, nper, start_yr, rebalance
+
+
+@pytest.mark.parametrize("case", list(random_withdrawal_cases(12)))
+def test_safe_withdrawal_rate_brackets_backtest_loop(case):
+    """the portfolio lasts with a withdrawal just under the rate and runs out
+    just over it, in the loop backtest"""
+
+    stocks, cash, corp_bonds, nper, start_yr, rebalance = case
+    tol = 1e-5
+    rates = app.withdrawal_periods(stocks, cash, nper, corp_bonds, rebalance)
+    rate = rates.loc[rates["Start"] == start_yr, "Rate"].iat[0]
+
+    def ending_balance(withdrawal_rate):
+        dff = app.backtest_loop(
+            stocks,
+            cash,
+            1_000_000,
+            nper,
+            start_yr,
+            corp_bonds,
+            rebalance,
+            withdrawal=withdrawal_rate * 100,
+        )
+        return dff["Total"].iat[-1]
+
+    if rate > tol:
+        assert ending_balance(rate - tol) > 0
+    assert ending_balance(rate + 2 * tol) == 0
@@ -0,0 +1,66 @@
+import pytest
+
+import app
+
+"""
+==========================================================================
+best_allocations() finds the same best CAGRs within the loss limits as
+trying every position of the cash, corporate bonds and stocks sliders one
+year at a time
+
+Run with: python -m pytest
+"""
+
+
+def brute_force(planning_time, start_yr, max_loss, max_drawdown):
+    """CAGR of every slider allocation within the losses, in percent"""
+
+    returns = app.period_returns(planning_time, start_yr)[:, :-1].tolist()
+    cagrs = []
+    for cash in range(0, 101, 5):
+        for corp_bonds in range(0, 101 - cash, 5):
+            for stocks in range(0, 101 - cash - corp_bonds, 5):
+                bonds = 100 - cash - corp_bonds - stocks
+                weights = [cash / 100, bonds / 100, stocks / 100, corp_bonds / 100]
+                portfolio_returns = [
+                    sum(w * r for w, r in zip(weights, year)) for year in returns
+                ]
+                worst = min(portfolio_returns)
+                balance = peak = 1
+                drawdown = 0
+                for portfolio_return in portfolio_returns:
+                    balance *= 1 + portfolio_return
+                    peak = max(peak, balance)
+                    drawdown = min(drawdown, balance / peak - 1)
+                if max_loss is not None and worst < -max_loss / 100:
+                    continue
+                if max_drawdown is not None and drawdown < -max_drawdown / 100:
+                    continue
+                cagrs.append(balance ** (1 / len(returns)) - 1)
+    return sorted(cagrs, reverse=True)
+
+
+@pytest.mark.parametrize(
+    "planning_time, start_yr, max_loss, max_drawdown",
+    [
+        (20, 1929, 15, 25),
+        (30, 1970, 15, 25),
+        (97, 1928, 15, 25),
+        (10, 2000, 10, None),
+        (15, 1966, None, 20),
+        (5, 2005, None, None),
+        (1, 2008, 5, 5),
+        (3, 1930, 1, 1),
+    ],
+)
+def test_best_allocations_match_brute_force(
+    planning_time, start_yr, max_loss, max_drawdown
+):
+    dff = app.best_allocations(planning_time, start_yr, max_loss, max_drawdown)
+    expected = brute_force(planning_time, start_yr, max_loss, max_drawdown)
+
+    assert dff["CAGR"].tolist() == pytest.approx(expected[: app.OPTIMIZER_RESULTS])
+    if max_loss is not None:
+        assert (dff["Worst"] >= -max_loss / 100).all()
+    if max_drawdown is not None:
+        assert (dff["Max Drawdown"] >= -max_drawdown / 100).all()
@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+import app
+
+"""
+==========================================================================
+WindowIndex CAGRs and worst years match going through the window of
+returns one year at a time
+
+Run with: python -m pytest
+"""
+
+COLUMNS = list(app.df.columns[1:])
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_window_index_matches_min(seed):
+    rng = random.Random(seed)
+    min_yr, max_yr = int(app.df["Year"].iat[0]), int(app.df["Year"].iat[-1])
+    for _ in range(50):
+        col = rng.choice(COLUMNS)
+        first_yr = rng.randint(min_yr, max_yr)
+        last_yr = rng.randint(first_yr, max_yr)
+        window = app.df[(app.df["Year"] >= first_yr) & (app.df["Year"] <= last_yr)]
+        returns = window[col].tolist()
+
+        worst = min(returns)
+        worst_yr = int(window["Year"].iat[returns.index(worst)])
+        assert app.window_index.worst(col, first_yr, last_yr) == (worst, worst_yr)
+
+        growth = 1.0
+        for r in returns:
+            growth *= 1 + r
+        cagr = growth ** (1 / len(returns)) - 1
+        assert app.window_index.cagr(col, first_yr, last_yr) == pytest.approx(cagr)
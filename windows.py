@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+"""
+==========================================================================
+Constant time window statistics over the annual returns
+
+Built once from the returns dataframe.  For each asset column it holds the
+cumulative log growth, so the CAGR for any window is one subtraction, and a
+sparse table of the position of the minimum return for every power of two
+length window, so the worst year in any window is two comparisons.
+"""
+
+
+class WindowIndex:
+    """CAGR and worst 1 year return for any window of years and any column"""
+
+    def __init__(self, df):
+        """df has a Year column and one column of annual returns per asset,
+        with one row for every year
+        """
+
+        self.first_yr = int(df["Year"].iat[0])
+        self.years = df["Year"].to_numpy(dtype=int)
+        self.columns = {col: i for i, col in enumerate(df.columns[1:])}
+        returns = df[df.columns[1:]].to_numpy(dtype=float)
+        self.returns = returns
+
+        # log_growth[i] is the log growth up to the start of row i
+        self.log_growth = np.zeros((len(returns) + 1, returns.shape[1]))
+        np.cumsum(np.log1p(returns), axis=0, out=self.log_growth[1:])
+
+        # sparse[k][i] is the row of the minimum return in rows i to i + 2**k - 1,
+        # the earliest row on ties
+        rows = np.arange(len(returns))[:, None].repeat(returns.shape[1], axis=1)
+        self.sparse = [rows]
+        cols = np.arange(returns.shape[1])
+        k = 1
+        while 2**k <= len(returns):
+            prev = self.sparse[-1]
+            left = prev[: len(prev) - 2 ** (k - 1)]
+            right = prev[2 ** (k - 1) :]
+            take_right = returns[right, cols] < returns[left, cols]
+            self.sparse.append(np.where(take_right, right, left))
+            k += 1
+
+    def _rows(self, first_yr, last_yr):
+        return int(first_yr) - self.first_yr, int(last_yr) - self.first_yr
+
+    def cagr(self, col, first_yr, last_yr):
+        """compound annual growth rate for the returns from first_yr to last_yr"""
+
+        first, last = self._rows(first_yr, last_yr)
+        i = self.columns[col]
+        log_growth = self.log_growth[last + 1, i] - self.log_growth[first, i]
+        return np.expm1(log_growth / (last - first + 1))
+
+    def growth(self, col, first_yr, last_yr):
+        """growth of $1 for the returns from first_yr to last_yr"""
+
+        first, last = self._rows(first_yr, last_yr)
+        i = self.columns[col]
+        return np.exp(self.log_growth[last + 1, i] - self.log_growth[first, i])
+
+    def worst(self, col, first_yr, last_yr):
+        """worst 1 year return and the year it happened from first_yr to last_yr"""
+
+        first, last = self._rows(first_yr, last_yr)
+        i = self.columns[col]
+        k = (last - first + 1).bit_length() - 1
+        left = self.sparse[k][first, i]
+        right = self.sparse[k][last - 2**k + 1, i]
+        row = right if self.returns[right, i] < self.returns[left, i] else left
+        return self.returns[row, i], self.years[row]